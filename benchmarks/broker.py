@@ -0,0 +1,313 @@
+"""
+In-memory stand-in for the MQTT broker used by the benchmarks
+
+MemoryClient implements the subset of asyncio_mqtt.Client used by the gateway, so
+it can replace the client class of the messenger without a running broker.
+Filtered messages are routed through the same topic matcher paho uses, so the
+dispatch cost is representative of the real client.
+
+TcpBroker serves the same broker to other processes, which connect with TcpClient.
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+from contextlib import asynccontextmanager, suppress
+
+from paho.mqtt.client import topic_matches_sub
+from paho.mqtt.matcher import MQTTMatcher
+
+
+# make the gateway modules importable
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "gateway"))
+
+
+class MemoryMessage:
+    __slots__ = ("topic", "payload", "qos", "retain")
+
+    def __init__(self, topic, payload, qos=0, retain=False):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+
+class MemoryBroker:
+    """
+    Routes messages between all clients of the same process
+    """
+
+    def __init__(self):
+        self.clients = []
+        self.retained = {}
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, message):
+        self.published += 1
+
+        if message.retain:
+            if message.payload:
+                self.retained[message.topic] = message
+            else:
+                self.retained.pop(message.topic, None)
+
+        for client in self.clients:
+            client._deliver(message)
+
+
+class MemoryClient:
+    """
+    Replacement for asyncio_mqtt.Client
+    """
+
+    broker = MemoryBroker()
+
+    # queue size used if the caller does not specify one (0 is unbounded)
+    queue_maxsize = 0
+
+    def __init__(self, hostname, port=1883, *, will=None, **kwargs):
+        self._subscriptions = []
+        self._filters = MQTTMatcher()
+        self._will = will
+        self._connected = False
+        self.on_publish = None
+
+    async def __aenter__(self):
+        MemoryClient.broker.clients.append(self)
+        self._connected = True
+        return self
+
+    async def __aexit__(self, *args):
+        if self._connected:
+            self._connected = False
+            MemoryClient.broker.clients.remove(self)
+
+    def kill(self):
+        """
+        Drop the connection without disconnecting, so the broker sends the will
+        """
+
+        if not self._connected:
+            return
+
+        self._connected = False
+        MemoryClient.broker.clients.remove(self)
+
+        if self._will is not None:
+            payload = self._will.payload
+            if isinstance(payload, str):
+                payload = payload.encode()
+
+            MemoryClient.broker.publish(
+                MemoryMessage(
+                    self._will.topic, payload or b"", self._will.qos, self._will.retain
+                )
+            )
+
+    def _deliver(self, message):
+        if not any(topic_matches_sub(s, message.topic) for s in self._subscriptions):
+            return
+
+        for queue in self._filters.iter_match(message.topic):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                MemoryClient.broker.dropped += 1
+
+    async def subscribe(self, topic, *args, **kwargs):
+        self._subscriptions.append(topic)
+
+        for message in list(MemoryClient.broker.retained.values()):
+            if topic_matches_sub(topic, message.topic):
+                self._deliver(message)
+
+    async def publish(self, topic, payload=None, qos=0, retain=False, **kwargs):
+        if not self._connected:
+            raise ConnectionError("Not connected")
+
+        if isinstance(payload, str):
+            payload = payload.encode()
+
+        message = MemoryMessage(topic, payload or b"", qos, retain)
+        if self.on_publish is not None:
+            self.on_publish(message)
+
+        MemoryClient.broker.publish(message)
+
+    @asynccontextmanager
+    async def filtered_messages(self, topic_filter, *, queue_maxsize=None):
+        if queue_maxsize is None:
+            queue_maxsize = MemoryClient.queue_maxsize
+
+        queue = asyncio.Queue(maxsize=queue_maxsize)
+        self._filters[topic_filter] = queue
+
+        async def messages():
+            while True:
+                yield await queue.get()
+
+        try:
+            yield messages()
+        finally:
+            del self._filters[topic_filter]
+
+
+def _encode(message):
+    return {
+        "topic": message.topic,
+        "payload": message.payload.hex(),
+        "qos": message.qos,
+        "retain": message.retain,
+    }
+
+
+def _decode(data):
+    return MemoryMessage(
+        data["topic"], bytes.fromhex(data["payload"]), data["qos"], data["retain"]
+    )
+
+
+class TcpSession:
+    """
+    Connection of a single TcpClient to the broker
+    """
+
+    def __init__(self, writer):
+        self._writer = writer
+        self._subscriptions = []
+
+    def _deliver(self, message):
+        if any(topic_matches_sub(s, message.topic) for s in self._subscriptions):
+            self._writer.write((json.dumps(_encode(message)) + "\n").encode())
+
+
+class TcpBroker:
+    """
+    Serves a MemoryBroker to clients of other processes
+
+    Requests and messages are exchanged as JSON lines. The will of a client is
+    published if its connection drops without a disconnect request.
+    """
+
+    def __init__(self):
+        self.broker = MemoryBroker()
+        self._server = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._server = await asyncio.start_server(self._session, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _session(self, reader, writer):
+        session = TcpSession(writer)
+        self.broker.clients.append(session)
+        will = None
+
+        try:
+            async for line in reader:
+                request = json.loads(line)
+
+                if request["op"] == "will":
+                    will = _decode(request["message"])
+
+                elif request["op"] == "subscribe":
+                    session._subscriptions.append(request["topic"])
+                    for message in list(self.broker.retained.values()):
+                        if topic_matches_sub(request["topic"], message.topic):
+                            session._deliver(message)
+
+                elif request["op"] == "publish":
+                    self.broker.publish(_decode(request["message"]))
+
+                elif request["op"] == "disconnect":
+                    will = None
+                    break
+
+        except ConnectionError:
+            pass
+
+        finally:
+            self.broker.clients.remove(session)
+            if will is not None:
+                self.broker.publish(will)
+            writer.close()
+
+
+class TcpClient(MemoryClient):
+    """
+    Replacement for asyncio_mqtt.Client connecting to a TcpBroker at "host:port"
+    """
+
+    def __init__(self, hostname, port=1883, *, will=None, **kwargs):
+        super().__init__(hostname, port, will=will, **kwargs)
+
+        host, _, port = hostname.rpartition(":")
+        self._address = (host, int(port))
+        self._writer = None
+        self._receiver = None
+
+    async def _send(self, request):
+        self._writer.write((json.dumps(request) + "\n").encode())
+        await self._writer.drain()
+
+    async def _receive(self, reader):
+        async for line in reader:
+            self._deliver(_decode(json.loads(line)))
+
+    async def __aenter__(self):
+        reader, self._writer = await asyncio.open_connection(*self._address)
+        self._receiver = asyncio.create_task(self._receive(reader))
+        self._connected = True
+
+        if self._will is not None:
+            payload = self._will.payload
+            if isinstance(payload, str):
+                payload = payload.encode()
+
+            will = MemoryMessage(
+                self._will.topic, payload or b"", self._will.qos, self._will.retain
+            )
+            await self._send({"op": "will", "message": _encode(will)})
+
+        return self
+
+    async def __aexit__(self, *args):
+        if not self._connected:
+            return
+
+        self._connected = False
+        self._receiver.cancel()
+        with suppress(ConnectionError):
+            await self._send({"op": "disconnect"})
+        self._writer.close()
+
+    def kill(self):
+        if not self._connected:
+            return
+
+        self._connected = False
+        self._receiver.cancel()
+        self._writer.transport.abort()
+
+    async def subscribe(self, topic, *args, **kwargs):
+        self._subscriptions.append(topic)
+        await self._send({"op": "subscribe", "topic": topic})
+
+    async def publish(self, topic, payload=None, qos=0, retain=False, **kwargs):
+        if not self._connected:
+            raise ConnectionError("Not connected")
+
+        if isinstance(payload, str):
+            payload = payload.encode()
+
+        message = MemoryMessage(topic, payload or b"", qos, retain)
+        if self.on_publish is not None:
+            self.on_publish(message)
+
+        await self._send({"op": "publish", "message": _encode(message)})
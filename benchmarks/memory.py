@@ -0,0 +1,100 @@
+"""
+Memory footprint of eq3smart devices
+
+Starts fleets of devices through the gateway like the configuration would, lets
+every device complete its initial status query against simulated thermostats and
+reports the memory allocated per running device (measured with tracemalloc).
+The history of a device grows with every poll until it is full, its bound is
+reported separately.
+
+    python benchmarks/memory.py --devices 100 1000 5000
+"""
+
+import argparse
+import asyncio
+import gc
+import tracemalloc
+
+from broker import MemoryBroker, MemoryClient
+from simulation import SimulatedBleManager
+
+import mqtt.messenger
+
+from devices import load_module
+from main import Gateway
+from mqtt import HassMqttMessenger
+from tools import Config, Tasks, History
+
+
+class SinkBroker(MemoryBroker):
+    """
+    Broker that drops all messages, so retained messages are not counted
+    """
+
+    def publish(self, message):
+        self.published += 1
+
+
+def address(i):
+    return ":".join(f"{b:02X}" for b in i.to_bytes(6, "big"))
+
+
+async def measure(count):
+    MemoryClient.broker = SinkBroker()
+    mqtt.messenger.Client = MemoryClient
+
+    messenger = HassMqttMessenger(Config(config={"mqtt": {"broker": "memory"}}))
+    ble = SimulatedBleManager(schedule=False)
+
+    # module imports are not part of the device footprint
+    load_module("eq3smart")
+    import bleak.exc
+
+    async with messenger:
+        async with Tasks() as tasks:
+            gateway = Gateway(None, tasks, messenger, ble)
+
+            # simulated thermostats are not part of the device footprint
+            for i in range(count):
+                ble.thermostat(address(i))
+
+            gc.collect()
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+
+            for i in range(count):
+                await gateway.start_device(
+                    f"bench{i}",
+                    {"module": "eq3smart", "mac": address(i), "schedule": False},
+                )
+
+            # wait until every device published its first state
+            devices = list(messenger.devices.values())
+            while not all(device.status() for device in devices):
+                await asyncio.sleep(0.05)
+
+            gc.collect()
+            after = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            for id in list(gateway.running):
+                await gateway.stop_device(id)
+
+    return (after - before) / count
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, nargs="+", default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    print(f"{'devices':>8} {'bytes/device':>13}")
+    for count in args.devices:
+        print(f"{count:>8} {asyncio.run(measure(count)):>13.0f}")
+
+    bound = History.BYTES_PER_SAMPLE * History.DEFAULT_SIZE
+    print(f"full history adds up to {bound} bytes")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,185 @@
+"""
+MQTT ingest and dispatch benchmark
+
+Drives HassMqttMessenger and HassMqttDevice.listen with an in-memory broker. A
+publisher sends a fixed rate of messages, mixing foreign Home Assistant topics,
+echoes of the state topics of the gateway devices and commands addressed to random
+devices. Command latency is measured from publish until the command handler runs.
+
+    python benchmarks/mqtt_dispatch.py --devices 10 100 1000 --rate 5000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from broker import MemoryBroker, MemoryClient
+
+import mqtt.messenger
+
+from mqtt import HassMqttMessenger, HassMqttDevice
+from tools import Config
+
+
+# time between two bursts of the publisher
+TICK = 0.01
+
+
+class BenchDevice(HassMqttDevice):
+    """
+    Device that only records the latency of received commands
+    """
+
+    def __init__(self, id, mqtt, latencies):
+        super().__init__(id, Config(config={}), mqtt, None)
+        self._latencies = latencies
+
+    @property
+    def component(self):
+        return "climate"
+
+    async def _mqtt_temperature_set(self, payload):
+        self._latencies.append(time.perf_counter_ns() - int(payload))
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def scenario(devices, rate, duration, commands, echo, seed=0):
+    MemoryClient.broker = MemoryBroker()
+    mqtt.messenger.Client = MemoryClient
+
+    latencies = []
+    messenger = HassMqttMessenger(Config(config={"mqtt": {"broker": "memory"}}))
+
+    async with messenger:
+        ids = [f"bench{i}" for i in range(devices)]
+        tasks = []
+        for id in ids:
+            device = BenchDevice(id, messenger, latencies)
+            messenger.register(device)
+            tasks.append(asyncio.create_task(device.listen()))
+
+        # wait until all devices subscribed
+        await asyncio.sleep(0.1)
+
+        publisher = MemoryClient("memory")
+        async with publisher:
+            generator = random.Random(seed)
+            foreign = [f"homeassistant/sensor/node{i}/state" for i in range(500)]
+            sent = {"foreign": 0, "echo": 0, "command": 0}
+
+            burst = max(1, round(rate * TICK))
+            start = time.perf_counter()
+            cpu = time.process_time()
+            deadline = start + duration
+            tick = start
+
+            while tick < deadline:
+                for _ in range(burst):
+                    choice = generator.random()
+                    if choice < commands:
+                        id = generator.choice(ids)
+                        topic = f"homeassistant/climate/eq3bt/{id}/temperature_set"
+                        await publisher.publish(topic, str(time.perf_counter_ns()))
+                        sent["command"] += 1
+                    elif choice < commands + echo:
+                        id = generator.choice(ids)
+                        topic = f"homeassistant/climate/eq3bt/{id}/state"
+                        await publisher.publish(topic, '{"available": true}')
+                        sent["echo"] += 1
+                    else:
+                        topic = generator.choice(foreign)
+                        await publisher.publish(topic, "21.5")
+                        sent["foreign"] += 1
+
+                # keep the rate independent of the dispatch speed
+                tick += TICK
+                await asyncio.sleep(max(0, tick - time.perf_counter()))
+
+            # let the devices drain their queues
+            drain = time.perf_counter() + 5
+            while len(latencies) < sent["command"] and time.perf_counter() < drain:
+                await asyncio.sleep(TICK)
+
+            elapsed = time.perf_counter() - start
+            cpu = time.process_time() - cpu
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    total = sum(sent.values())
+    latencies = [latency / 1e6 for latency in latencies]
+
+    return {
+        "devices": devices,
+        "messages": total,
+        "rate": round(total / duration),
+        "p50_ms": percentile(latencies, 50),
+        "p90_ms": percentile(latencies, 90),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies, default=None),
+        "mean_ms": statistics.mean(latencies) if latencies else None,
+        "cpu_us_per_message": cpu / total * 1e6,
+        "elapsed_s": elapsed,
+        "dropped": MemoryClient.broker.dropped,
+        "undelivered": sent["command"] - len(latencies),
+    }
+
+
+def report(result):
+    def ms(value):
+        return "-" if value is None else f"{value:.3f}"
+
+    print(
+        f"{result['devices']:>6} {result['rate']:>8} "
+        f"{ms(result['p50_ms']):>9} {ms(result['p90_ms']):>9} "
+        f"{ms(result['p99_ms']):>9} {ms(result['max_ms']):>9} "
+        f"{result['cpu_us_per_message']:>10.1f} "
+        f"{result['dropped']:>8} {result['undelivered']:>11}"
+    )
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--rate", type=int, default=5000, help="messages per second")
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds")
+    parser.add_argument("--commands", type=float, default=0.1, help="command ratio")
+    parser.add_argument("--echo", type=float, default=0.2, help="state echo ratio")
+    parser.add_argument(
+        "--queue-size", type=int, default=0, help="per-device queue size (0 unbounded)"
+    )
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    MemoryClient.queue_maxsize = args.queue_size
+
+    if not args.json:
+        print(
+            f"{'devices':>6} {'msg/s':>8} {'p50 ms':>9} {'p90 ms':>9} "
+            f"{'p99 ms':>9} {'max ms':>9} {'cpu us/msg':>10} "
+            f"{'dropped':>8} {'undelivered':>11}"
+        )
+
+    for devices in args.devices:
+        result = asyncio.run(
+            scenario(devices, args.rate, args.duration, args.commands, args.echo)
+        )
+
+        if args.json:
+            print(json.dumps(result))
+        else:
+            report(result)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,156 @@
+"""
+Simulated eQ-3 thermostats shared by the benchmarks and the tests
+
+SimulatedBleManager replaces the BLE backend, so devices can be driven through the
+regular gateway code without radios. Messenger replaces the MQTT messenger for
+tests of a single device.
+"""
+
+import asyncio
+import os
+import sys
+
+# make the gateway modules importable
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "gateway"))
+
+from eq3bt.eq3btsmart import PROP_SCHEDULE_QUERY, PROP_SCHEDULE_RETURN
+from eq3bt.structures import Schedule, NAME_TO_CMD, NAME_TO_DAY
+
+from ble import BleManager
+from devices.mixins.schedule import ScheduleMixin
+
+
+# status response of a thermostat in manual mode at 21°C
+STATUS = bytes.fromhex("02010930042a0000000018032a2207")
+
+# program of every day until changed
+PERIODS = [
+    {"temperature": 17.0, "until": "06:00"},
+    {"temperature": 21.0, "until": "22:00"},
+    {"temperature": 17.0, "until": "24:00"},
+]
+
+DAYS = {index: name for name, index in NAME_TO_DAY.items()}
+
+
+class Handle:
+    """
+    Stands in for a scanned device
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.details = None
+
+
+class Advertisement:
+    def __init__(self, rssi=-50):
+        self.rssi = rssi
+
+
+class Thermostat:
+    """
+    Simulated device
+
+    Schedule queries are answered with the stored program of the day (unless the
+    device is configured to ignore them), all other requests with a status.
+    """
+
+    def __init__(self, schedule=True, delay=0.0):
+        self._schedule = {day: list(PERIODS) for day in NAME_TO_DAY} if schedule else {}
+        self._delay = delay
+        self._callback = None
+        self.writes = []
+
+    async def __aenter__(self):
+        if self._delay:
+            await asyncio.sleep(self._delay)
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def start_notify(self, characteristic, callback, **kwargs):
+        self._callback = callback
+
+    async def stop_notify(self, characteristic):
+        self._callback = None
+
+    def _response(self, data):
+        if data[0] == PROP_SCHEDULE_QUERY:
+            day = DAYS[data[1]]
+            if day not in self._schedule:
+                return None
+
+            frame = ScheduleMixin._schedule_frame(day, self._schedule[day])
+            return bytes([PROP_SCHEDULE_RETURN]) + frame[1:]
+
+        if data[0] == NAME_TO_CMD["write"]:
+            parsed = Schedule.parse(data)
+            if parsed.day in self._schedule:
+                self._schedule[parsed.day] = ScheduleMixin._schedule_periods(parsed)
+            return STATUS
+
+        return STATUS
+
+    async def write_gatt_char(self, characteristic, data, *args, **kwargs):
+        data = bytes(data)
+        self.writes.append(data)
+
+        if self._delay:
+            await asyncio.sleep(self._delay)
+
+        response = self._response(data)
+        if response is not None and self._callback is not None:
+            result = self._callback(characteristic, bytearray(response))
+            if asyncio.iscoroutine(result):
+                await result
+
+
+class SimulatedBleManager(BleManager):
+    """
+    Radio that reaches the given devices (address -> RSSI), or all registered ones
+    """
+
+    def __init__(self, signal=None, schedule=True, delay=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self._signal = signal
+        self._schedule = schedule
+        self._delay = delay
+        self.thermostats = {}
+
+    async def _unsafe_discover(self, timeout=15.0, measure=False):
+        signal = self._signal
+        if signal is None:
+            signal = {address: -50 for address in self._registry}
+
+        for address, rssi in signal.items():
+            if address in self._watched:
+                self._watched[address] = rssi
+            if address in self._registry:
+                self._registry[address]._rssi = rssi
+                self._registry[address]._handle = Handle(address)
+
+    def thermostat(self, address):
+        if address not in self.thermostats:
+            self.thermostats[address] = Thermostat(self._schedule, self._delay)
+        return self.thermostats[address]
+
+    def _client(self, handle):
+        return self.thermostat(handle.address)
+
+
+class Messenger:
+    """
+    Replacement for the MQTT messenger of a single device, keeps the last message
+    of every topic
+    """
+
+    def __init__(self):
+        self.published = {}
+
+    def device_topic(self, device):
+        return f"homeassistant/{device.component}/eq3bt/{device.id}"
+
+    async def publish(self, device, topic, message, **kwargs):
+        self.published[topic] = message
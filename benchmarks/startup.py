@@ -0,0 +1,166 @@
+"""
+Startup benchmark of the gateway
+
+Measures the import time of the gateway and the time from process start until the
+first MQTT message is published. The broker is replaced by an in-memory stand-in
+and BLE traffic is replayed from a generated capture, so no radio is required.
+
+Exits with a non-zero status if one of the budgets is exceeded:
+
+    python benchmarks/startup.py --import-budget 250 --publish-budget 500
+"""
+
+import time
+
+START = time.perf_counter()
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+GATEWAY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gateway")
+
+# default budgets (ms)
+IMPORT_BUDGET = 250.0
+PUBLISH_BUDGET = 500.0
+
+
+def measure_import():
+    """
+    Cumulative import time of the main module in a fresh interpreter (ms)
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=GATEWAY,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| main$", line)
+        if match:
+            return int(match.group(1)) / 1e3
+
+    raise Exception("main not found in import times")
+
+
+def measure_first_publish():
+    """
+    Time from interpreter start until the first publish in a fresh process (ms)
+    """
+
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])["first_publish"]
+
+
+def child():
+    """
+    Run the gateway until it publishes the first message
+    """
+
+    sys.path.insert(0, GATEWAY)
+    import main
+
+    import mqtt.messenger
+    from broker import MemoryClient
+    from simulation import STATUS
+
+    published = []
+
+    def on_publish(message):
+        if not published:
+            published.append((time.perf_counter() - START) * 1e3)
+            for task in asyncio.all_tasks():
+                task.cancel()
+
+    class Client(MemoryClient):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.on_publish = on_publish
+
+    mqtt.messenger.Client = Client
+
+    with tempfile.TemporaryDirectory() as directory:
+        config = os.path.join(directory, "config.yaml")
+        capture = os.path.join(directory, "capture.jsonl")
+
+        with open(config, "w") as config_file:
+            json.dump(
+                {
+                    "mqtt": {"broker": "memory"},
+                    "snapshot": "",
+                    "reload": 0,
+                    "monitor": {"threshold": 0},
+                    "devices": {
+                        "bench": {"module": "eq3smart", "mac": "AA", "schedule": False}
+                    },
+                },
+                config_file,
+            )
+
+        with open(capture, "w") as capture_file:
+            for event in [
+                {"t": 0.0, "a": "AA", "e": "connect", "ok": True},
+                {"t": 0.1, "a": "AA", "e": "write", "d": "03", "ok": True},
+                {"t": 0.1, "a": "AA", "e": "notify", "d": STATUS.hex(), "ok": True},
+                {"t": 0.2, "a": "AA", "e": "disconnect", "ok": True},
+            ]:
+                capture_file.write(json.dumps(event) + "\n")
+
+        args = argparse.Namespace(
+            config=config,
+            profile=None,
+            profile_output=os.path.join(directory, "profile.json"),
+            record=None,
+            replay=capture,
+            replay_speed=0,
+        )
+
+        try:
+            asyncio.run(main.run(args))
+        except asyncio.CancelledError:
+            pass
+
+    print(json.dumps({"first_publish": published[0]}))
+
+
+def run():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--child", action="store_true")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET)
+    parser.add_argument("--publish-budget", type=float, default=PUBLISH_BUDGET)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return 0
+
+    imports = statistics.median(measure_import() for _ in range(args.runs))
+    publish = statistics.median(measure_first_publish() for _ in range(args.runs))
+
+    print(f"import time:        {imports:8.1f} ms (budget {args.import_budget} ms)")
+    print(f"first publish:      {publish:8.1f} ms (budget {args.publish_budget} ms)")
+
+    if imports > args.import_budget or publish > args.publish_budget:
+        print("startup budget exceeded")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
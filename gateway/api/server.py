@@ -0,0 +1,153 @@
+import json
+import logging
+import asyncio
+import os
+import time
+
+from contextlib import suppress
+
+from zones import Zone
+from tools import Config
+from tools import tracer
+
+
+class LocalApi:
+    """
+    Local control API that bypasses the MQTT broker
+
+    Clients connect via a Unix socket or localhost TCP and exchange one JSON
+    object per line. Reads are served from the cached device state, commands
+    take the same path as MQTT commands and respond with the resulting state.
+
+    Requests:
+        {"op": "get", "device": "<id>"}            (omit device to get all)
+        {"op": "set_temperature", "device": "<id>", "value": 21.5}
+        {"op": "set_mode", "device": "<id>", "value": "heat"}
+        {"op": "bulk", "devices": ["<id>", ...], "command": "set_mode", "value": "off"}
+        {"op": "history", "device": "<id>", "since": <unix time>, "points": 60}
+    """
+
+    COMMANDS = {
+        "set_temperature": "temperature_set",
+        "set_mode": "mode_set",
+    }
+
+    def __init__(self, config, mqtt, ble):
+        self._config = config
+        self._mqtt = mqtt
+        self._ble = ble
+
+    def __str__(self):
+        return "local API"
+
+    def _device(self, id):
+        device = self._mqtt.device(id)
+        if device is None:
+            raise Exception(f"Unknown device {id}")
+        return device
+
+    async def _get(self, request):
+        if "device" in request:
+            return {"state": self._device(request["device"]).status()}
+
+        return {
+            "states": {id: device.status() for id, device in self._mqtt.devices.items()}
+        }
+
+    async def _command(self, request):
+        device = self._device(request["device"])
+        command = LocalApi.COMMANDS[request["op"]]
+
+        with tracer.trace("api.command", device=device.id, command=command):
+            success = await device.command(command, str(request["value"]))
+
+        return {"success": success is not False, "state": device.status()}
+
+    async def _bulk(self, request):
+        command = LocalApi.COMMANDS[request["command"]]
+
+        # plan devices like a zone without publishing progress
+        zone = Zone("api", Config(config=request), self._mqtt, self._ble)
+        with tracer.trace("api.bulk", command=command):
+            status = await zone.execute(command, str(request["value"]))
+
+        return {
+            "results": status["results"],
+            "states": {
+                id: self._mqtt.device(id).status()
+                for id in status["results"]
+                if self._mqtt.device(id) is not None
+            },
+        }
+
+    async def _history(self, request):
+        device = self._device(request["device"])
+        return {"history": device.history(request.get("since"), request.get("points"))}
+
+    async def _handle(self, request):
+        op = request.get("op")
+        if op == "get":
+            return await self._get(request)
+        if op in LocalApi.COMMANDS:
+            return await self._command(request)
+        if op == "bulk":
+            return await self._bulk(request)
+        if op == "history":
+            return await self._history(request)
+
+        raise Exception(f"Unknown operation {op}")
+
+    async def _client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                start = time.perf_counter()
+                try:
+                    response = await self._handle(json.loads(line))
+                    response["ok"] = True
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logging.debug("API request failed", exc_info=True)
+                    response = {"ok": False, "error": str(e)}
+
+                response["elapsed_ms"] = round((time.perf_counter() - start) * 1e3, 3)
+
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (asyncio.CancelledError, ConnectionError):
+            # client disconnected or server shutting down
+            pass
+        finally:
+            writer.close()
+
+    async def run(self):
+        socket = self._config.optional("socket")
+        if socket is not None:
+            # remove stale socket from previous runs
+            if os.path.exists(socket):
+                os.unlink(socket)
+            server = await asyncio.start_unix_server(self._client, path=socket)
+
+            # only the user running the gateway may control the devices
+            os.chmod(socket, 0o600)
+        else:
+            server = await asyncio.start_server(
+                self._client,
+                host=self._config.optional("host", "127.0.0.1"),
+                port=self._config.optional("port", 8765),
+            )
+
+        logging.info(f"Serving {self} on {socket or server.sockets[0].getsockname()}")
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            # do not leave the socket behind
+            if socket is not None:
+                with suppress(FileNotFoundError):
+                    os.unlink(socket)
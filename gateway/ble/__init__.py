@@ -1,2 +1,4 @@
 from .manager import BleManager
 from .connection import BleConnection
+from .record import Recorder
+from .replay import ReplayBleManager
@@ -4,20 +4,36 @@ import sys
 
 from contextlib import AsyncExitStack
 
-from bleak import BleakClient
+from tools import tracer
 
 
-class BleConnection(AsyncExitStack):
+class BleConnection:
     """
     Manages and establishes the connection to a single BLE device
+
+    The exit stack holding the semaphore and the client only exists while the
+    device is connected. Concurrent users of the same device (e.g. polling and a
+    command) are serialized, so the stack always belongs to the current user.
     """
 
-    def __init__(self, address, manager):
-        super().__init__()
+    __slots__ = (
+        "_address",
+        "_handle",
+        "_rssi",
+        "_connected",
+        "_manager",
+        "_lock",
+        "_stack",
+    )
 
+    def __init__(self, address, manager):
         self._address = address
         self._handle = None
+        self._rssi = None
+        self._connected = False
         self._manager = manager
+        self._lock = asyncio.Lock()
+        self._stack = None
 
         # automatically register with manager
         self._manager.register(self)
@@ -26,38 +42,63 @@ class BleConnection(AsyncExitStack):
     def address(self):
         return self._address
 
+    @property
+    def discovered(self):
+        return self._handle is not None
+
+    @property
+    def connected(self):
+        return self._connected
+
+    @property
+    def rssi(self):
+        return self._rssi
+
     async def __aenter__(self):
-        await super().__aenter__()
+        await self._lock.acquire()
+        self._stack = AsyncExitStack()
+        acquire = None
 
         try:
 
-            acquire = asyncio.create_task(
-                self.enter_async_context(self._manager.semaphore)
-            )
-            while True:
-                # ensure unique access to BLE
-                done, _ = await asyncio.wait([acquire], timeout=10.0)
+            with tracer.span("ble.semaphore", address=self._address):
+                acquire = asyncio.create_task(
+                    self._stack.enter_async_context(self._manager.semaphore)
+                )
+                while True:
+                    # ensure unique access to BLE
+                    done, _ = await asyncio.wait([acquire], timeout=10.0)
 
-                if not done:
-                    logging.debug(f"{self._address} still waiting for semaphore...")
-                else:
-                    break
+                    if not done:
+                        logging.debug(f"{self._address} still waiting for semaphore...")
+                    else:
+                        break
 
             # manually trigger device discovery
             if self._handle is None:
-                await self._manager._unsafe_discover()
+                with tracer.span("ble.discover", address=self._address):
+                    await self._manager._unsafe_discover()
             if self._handle is None:
                 raise Exception(f"Connection [{self._address}] not available")
 
             logging.debug(f"Connection [{self._address}] established")
 
             # return connection
-            return await self.enter_async_context(
-                BleakClient(self._handle, timeout=20.0)
-            )
+            with tracer.span("ble.connect", address=self._address):
+                client = await self._stack.enter_async_context(
+                    self._manager.client(self._handle)
+                )
+            self._connected = True
+            return client
 
         except:
 
+            # stop waiting if cancelled while queued for the semaphore, an acquired
+            # semaphore is part of the stack and released below
+            if acquire is not None and not acquire.done():
+                acquire.cancel()
+                await asyncio.gather(acquire, return_exceptions=True)
+
             # ensure cleanup if exception is raised above
             if await self.__aexit__(*sys.exc_info()):
                 pass
@@ -65,7 +106,13 @@ class BleConnection(AsyncExitStack):
                 raise
 
     async def __aexit__(self, exc_type, exc, tb):
-        await super().__aexit__(exc_type, exc, tb)
+        self._connected = False
+
+        stack, self._stack = self._stack, None
+        try:
+            return await stack.__aexit__(exc_type, exc, tb)
+        finally:
+            self._lock.release()
 
     def lost(self):
         logging.warning(f"Lost connection [{self._address}]")
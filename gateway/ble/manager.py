@@ -1,7 +1,7 @@
 import asyncio
 import logging
 
-from bleak import BleakScanner
+from .record import RecordingClient
 
 
 logging.getLogger("bleak.backends").setLevel(logging.INFO)
@@ -16,9 +16,13 @@ class BleManager:
     During that process, the connection data for all known connections is updated.
     """
 
-    def __init__(self):
+    def __init__(self, recorder=None):
+        self._recorder = recorder
         self._registry = {}
         self._detected = None
+        self._watched = {}
+        # watched devices seen by a measuring scan
+        self._measured = None
 
         # python 3.9 and below must create semaphore on asyncio main loop
         self._semaphore = asyncio.Semaphore(1)
@@ -34,8 +38,15 @@ class BleManager:
     def _scanner_callback(self, handle, advertising_data):
         logging.debug(f"Detected {handle}")
 
+        if handle.address in self._watched:
+            self._watched[handle.address] = advertising_data.rssi
+            if self._measured is not None:
+                self._measured.add(handle.address)
+
         connection = self._registry.get(handle.address)
         if connection is not None:
+            connection._rssi = advertising_data.rssi
+
             if handle.address not in self._detected:
                 self._detected.add(handle.address)
                 connection._handle = handle
@@ -44,28 +55,96 @@ class BleManager:
                     f"Found {handle} ({len(self._detected)} of {len(self._registry)})"
                 )
 
-            # notify if all devices were found
-            if len(self._detected) == len(self._registry):
-                self._event.set()
+        self._check()
+
+    def _check(self):
+        """
+        Stop scanning once all registered devices are found
+
+        Watched devices are only waited for if the scan measures them, as they may
+        be out of range of this host.
+        """
+        if len(self._detected) < len(self._registry):
+            return
+        if self._measured is not None and len(self._measured) < len(self._watched):
+            return
+
+        self._event.set()
 
-    async def _unsafe_discover(self, timeout=15.0):
+    async def _unsafe_discover(self, timeout=15.0, measure=False):
         logging.info("Scanner on")
 
         self._detected = set()
+        self._measured = set() if measure else None
         self._event.clear()
+        self._check()
+
+        from bleak import BleakScanner
 
         async with BleakScanner(self._scanner_callback) as scanner:
             await asyncio.wait([self._event.wait()], timeout=timeout)
 
+        self._measured = None
         logging.info("Scanner off")
 
+    def client(self, handle):
+        """
+        Create a client for a scanned device
+        """
+
+        client = self._client(handle)
+        if self._recorder is not None:
+            client = RecordingClient(client, handle.address, self._recorder)
+
+        return client
+
+    def _client(self, handle):
+        from bleak import BleakClient
+
+        return BleakClient(handle, timeout=20.0)
+
     async def discover(self, *args, **kwargs):
         """
         Manually trigger the scanning process
+
+        With measure=True, the scan also waits for the signal strength of all
+        watched devices.
         """
         async with self._semaphore:
             await self._unsafe_discover(*args, **kwargs)
 
+    def plan(self, connections):
+        """
+        Order connections to minimize the total radio time of a batch
+
+        All connections share the radio and are used one after another, so the
+        strongest signals go first. Weak devices are most likely to need retries
+        and would otherwise delay all devices behind them.
+        """
+
+        return sorted(
+            connections,
+            key=lambda connection: -(
+                connection.rssi if connection.rssi is not None else -255
+            ),
+        )
+
+    def watch(self, address):
+        """
+        Measure the signal strength of a device without connecting to it
+        """
+        self._watched.setdefault(address, None)
+
+    def rssi(self, address):
+        """
+        Get the last measured signal strength of a device
+        """
+        connection = self._registry.get(address)
+        if connection is not None and connection.rssi is not None:
+            return connection.rssi
+
+        return self._watched.get(address)
+
     def register(self, connection):
         """
         Register a device so that it is recognized when scanning
@@ -73,3 +152,11 @@ class BleManager:
         self._registry[connection.address] = connection
 
         logging.info(f"Registered {connection.address}")
+
+    def unregister(self, connection):
+        """
+        Remove a device from the scanning process
+        """
+        self._registry.pop(connection.address, None)
+
+        logging.info(f"Unregistered {connection.address}")
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import time
+
+
+class Recorder:
+    """
+    Records BLE traffic to a JSON lines capture file
+
+    Every line holds a single event with the time since the start of the recording,
+    the device address, the event type and its outcome:
+
+        {"t": 1.234, "a": "00:1A:22:...", "e": "write", "d": "03...", "ok": true, "ms": 12.5}
+    """
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._file = None
+        self._start = time.monotonic()
+
+    def __enter__(self):
+        self._file = open(self._filename, "w", buffering=1)
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+
+    def record(
+        self, address, event, data=None, ok=True, ms=None, error=None, start=None
+    ):
+        if start is None:
+            start = time.monotonic()
+
+        entry = {
+            "t": round(start - self._start, 6),
+            "a": address,
+            "e": event,
+        }
+        if data is not None:
+            entry["d"] = bytes(data).hex()
+        entry["ok"] = ok
+        if ms is not None:
+            entry["ms"] = round(ms, 3)
+        if error is not None:
+            entry["err"] = error
+
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+class RecordingClient:
+    """
+    Wraps a BLE client to record connects, writes and notifications
+    """
+
+    def __init__(self, client, address, recorder):
+        self._client = client
+        self._address = address
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    async def _timed(self, event, awaitable, data=None):
+        # events are stamped with their start, notifications may arrive earlier
+        start = time.monotonic()
+        try:
+            result = await awaitable
+        except Exception as e:
+            ms = (time.monotonic() - start) * 1e3
+            self._recorder.record(
+                self._address, event, data, False, ms, repr(e), start=start
+            )
+            raise
+
+        ms = (time.monotonic() - start) * 1e3
+        self._recorder.record(self._address, event, data, ms=ms, start=start)
+        return result
+
+    async def __aenter__(self):
+        await self._timed("connect", self._client.__aenter__())
+        return self
+
+    async def __aexit__(self, *args):
+        self._recorder.record(self._address, "disconnect")
+        return await self._client.__aexit__(*args)
+
+    async def write_gatt_char(self, characteristic, data, *args, **kwargs):
+        return await self._timed(
+            "write",
+            self._client.write_gatt_char(characteristic, data, *args, **kwargs),
+            data,
+        )
+
+    async def start_notify(self, characteristic, callback, **kwargs):
+        async def notify(sender, data):
+            self._recorder.record(self._address, "notify", data)
+
+            result = callback(sender, data)
+            if asyncio.iscoroutine(result):
+                await result
+
+        return await self._client.start_notify(characteristic, notify, **kwargs)
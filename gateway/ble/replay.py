@@ -0,0 +1,136 @@
+import asyncio
+import collections
+import json
+import logging
+
+from .manager import BleManager
+
+
+class ReplayHandle:
+    """
+    Stands in for a scanned device during replay
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.details = None
+
+    def __str__(self):
+        return f"{self.address} (replay)"
+
+
+class ReplayClient:
+    """
+    Answers connects and writes of a single device from a capture
+    """
+
+    def __init__(self, manager, address):
+        self._manager = manager
+        self._address = address
+        self._callback = None
+
+    async def __aenter__(self):
+        event = self._manager._next(self._address, "connect")
+        await self._manager._sleep(event.get("ms", 0) / 1e3)
+
+        if not event["ok"]:
+            raise Exception(f"Replayed connect failed: {event.get('err')}")
+        return self
+
+    async def __aexit__(self, *args):
+        self._manager._next(self._address, "disconnect", required=False)
+
+    async def start_notify(self, characteristic, callback, **kwargs):
+        self._callback = callback
+
+    async def stop_notify(self, characteristic):
+        self._callback = None
+
+    async def write_gatt_char(self, characteristic, data, *args, **kwargs):
+        event = self._manager._next(self._address, "write")
+        await self._manager._sleep(event.get("ms", 0) / 1e3)
+
+        # commands must match, payloads may contain the current time
+        recorded = bytes.fromhex(event.get("d", ""))
+        if recorded[:1] != bytes(data)[:1]:
+            logging.warning(
+                f"Replay [{self._address}] wrote {bytes(data).hex()}, "
+                f"capture has {recorded.hex()}"
+            )
+
+        if not event["ok"]:
+            raise Exception(f"Replayed write failed: {event.get('err')}")
+
+        # deliver notifications that followed the write (the write took ms already)
+        time = event["t"] + event.get("ms", 0) / 1e3
+        for notification in self._manager._notifications(self._address):
+            await self._manager._sleep(notification["t"] - time)
+            time = max(time, notification["t"])
+
+            if self._callback is not None:
+                result = self._callback(
+                    characteristic, bytearray.fromhex(notification["d"])
+                )
+                if asyncio.iscoroutine(result):
+                    await result
+
+
+class ReplayBleManager(BleManager):
+    """
+    BLE backend that feeds a recorded capture back through the gateway
+
+    Devices are discovered if the capture contains traffic for them. Connects,
+    writes and notifications are answered from the capture in order, with the
+    recorded outcome and timing divided by the replay speed (0 means no delays).
+    """
+
+    def __init__(self, filename, speed=1.0):
+        super().__init__()
+
+        self._speed = speed
+        self._events = collections.defaultdict(collections.deque)
+
+        with open(filename, "r") as capture_file:
+            events = [json.loads(line) for line in capture_file if line.strip()]
+
+        # events are written on completion, replay them in order of their start
+        # (a notification can not start before the write it answers)
+        for event in sorted(events, key=lambda e: (e["t"], e["e"] == "notify")):
+            self._events[event["a"]].append(event)
+
+        logging.info(f"Replaying {filename} for {len(self._events)} devices")
+
+    async def _sleep(self, seconds):
+        if self._speed and seconds > 0:
+            await asyncio.sleep(seconds / self._speed)
+
+    def _next(self, address, kind, required=True):
+        """
+        Get the next recorded event of a kind, skipping unmatched events
+        """
+
+        events = self._events[address]
+        while events:
+            if events[0]["e"] == kind:
+                return events.popleft()
+
+            # only skip if the event is expected at all
+            if not required:
+                return None
+            logging.debug(f"Replay [{address}] skips {events.popleft()}")
+
+        if required:
+            raise Exception(f"Replay [{address}] capture exhausted")
+
+    def _notifications(self, address):
+        events = self._events[address]
+        while events and events[0]["e"] == "notify":
+            yield events.popleft()
+
+    async def _unsafe_discover(self, timeout=15.0, measure=False):
+        for address, connection in self._registry.items():
+            if self._events.get(address):
+                connection._handle = ReplayHandle(address)
+
+    def client(self, handle):
+        return ReplayClient(self, handle.address)
@@ -0,0 +1,25 @@
+import importlib
+
+
+# module name used in the config -> python module
+REGISTRY = {
+    "eq3smart": "devices.eq3smart",
+}
+
+_loaded = {}
+
+
+def load_module(name):
+    """
+    Resolve a device module by name
+
+    Modules are imported on first use only and cached afterwards, so devices of the
+    same module and config reloads do not import again.
+    """
+
+    module = _loaded.get(name)
+    if module is None:
+        module = importlib.import_module(REGISTRY.get(name, f"devices.{name}"))
+        _loaded[name] = module
+
+    return module
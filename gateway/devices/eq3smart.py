@@ -1,5 +1,11 @@
+import json
 import logging
 import asyncio
+import struct
+import time
+
+from contextlib import suppress
+from datetime import datetime
 
 from eq3bt.eq3btsmart import Thermostat, Mode
 from eq3bt.eq3btsmart import (
@@ -27,19 +33,46 @@ from eq3bt.eq3btsmart import (
     EQ3BT_ON_TEMP,
 )
 
-from bleak.exc import BleakDeviceNotFoundError
-
 from mqtt import HassMqttDevice
 from ble import BleConnection
 
 from tools import State
+from tools import History
+from tools import tracer
 
 from .mixins.retry import RetryMixin
 from .mixins.availability import AvailabilityMixin
 from .mixins.pair import PairMixin
+from .mixins.schedule import ScheduleMixin
+
+
+# translate device modes to Home Assistant modes
+MODES = {
+    Mode.Closed: "off",
+    Mode.Auto: "auto",
+    Mode.Boost: "heat",
+    Mode.Open: "heat",
+    Mode.Manual: "heat",
+    Mode.Away: "heat",
+}
+
+# offset of the valve position in a status response
+STATUS_VALVE = 3
+
+# seconds to wait for the notification answering a request
+NOTIFY_TIMEOUT = 15
+
+# notification type answering each request type
+RESPONSES = {
+    PROP_ID_QUERY: PROP_ID_RETURN,
+    PROP_INFO_QUERY: PROP_INFO_RETURN,
+    PROP_SCHEDULE_QUERY: PROP_SCHEDULE_RETURN,
+}
 
 
 class DummyConnection:
+    __slots__ = ("_device",)
+
     def __init__(self, address, interface):
         self._device = interface
 
@@ -50,9 +83,32 @@ class DummyConnection:
         pass
 
 
-class Device(HassMqttDevice, RetryMixin, AvailabilityMixin, PairMixin):
+class Device(HassMqttDevice, RetryMixin, AvailabilityMixin, PairMixin, ScheduleMixin):
     AVAILABILITY_RETRIES = 5
 
+    # attributes of all mixins are declared here, mixins only declare empty slots
+    __slots__ = (
+        "_availability_retries",
+        "_availability",
+        "_address",
+        "_pass",
+        "_polling",
+        "_schedule_sync_enabled",
+        "_connection",
+        "_state",
+        "_published",
+        "_history",
+        "_schedule",
+        "_schedule_version",
+        "_schedule_checked",
+        "_schedule_retry",
+        "_ready",
+        "_response",
+        "_expected",
+        "_message",
+        "_status_frame",
+    )
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -64,49 +120,150 @@ class Device(HassMqttDevice, RetryMixin, AvailabilityMixin, PairMixin):
         self._address = self._config.require("mac")
         self._pass = self._config.optional("pass")
         self._polling = self._config.optional("poll", 300)
+        self._schedule_sync_enabled = self._config.optional("schedule", True)
 
         # physical device connection
         self._connection = BleConnection(self._address, self._ble)
 
         # retained data
-        self._thermostat = Thermostat(None, self, DummyConnection)
         self._state = State()
-
-        # listening event
-        self._ready = asyncio.Event()
-        self._event = asyncio.Event()
+        self._published = {}
+        self._history = History(self._config.optional("history", History.DEFAULT_SIZE))
+        self._schedule_init()
+        self._restore()
+
+        # discovery sent and initial state pulled
+        self._ready = False
+        # pending response of the device and its notification type
+        self._response = None
+        self._expected = None
         self._message = None
+        # last status response of the device (None until it answered)
+        self._status_frame = None
 
     @property
     def component(self):
         return "climate"
 
+    @property
+    def connection(self):
+        return self._connection
+
+    @property
+    def poll_interval(self):
+        return self._polling
+
+    def _protocol(self):
+        """
+        Create a protocol helper that knows the last status of the device
+
+        Devices only keep the raw status response, the helper is created to decode
+        it or to build commands and dropped afterwards.
+        """
+
+        thermostat = Thermostat(None, self, DummyConnection)
+        if self._status_frame is not None:
+            thermostat.handle_notification(self._status_frame)
+        return thermostat
+
+    def _restore(self):
+        """
+        Restore the last known state from the snapshot
+        """
+
+        if self._snapshot is None:
+            return
+        data = self._snapshot.get(self._id)
+        if data is None:
+            return
+
+        self._state.restore(data["state"], {"mode": Mode})
+        self._published = data["published"]
+        for day, periods in data.get("schedule", {}).items():
+            self._schedule_update(day, periods)
+
+        if self._published.get("available"):
+            self._availability = self._availability_retries
+
+        logging.info(f"Restored {self}")
+
+    def _checkpoint(self):
+        """
+        Store the current state in the snapshot
+        """
+
+        if self._snapshot is None:
+            return
+
+        self._snapshot.update(
+            self._id,
+            {
+                "state": self._state.dump(),
+                "published": self._published,
+                "schedule": {
+                    day: periods for day, (_, periods) in self._schedule.items()
+                },
+            },
+        )
+
     async def _on_notify(self, characteristic, data):
 
-        # parse message
-        self._thermostat.handle_notification(data)
+        # hand the response to the pending request, other notifications
+        # (e.g. a status sent after a change on the device) are ignored
+        if self._response is None or self._response.done():
+            return
+        if self._expected is None or (data and data[0] == self._expected):
+            self._response.set_result(bytes(data))
 
-        # notify about received status
-        self._event.set()
+    async def _write(self, *values):
+        # bleak is only loaded once the device is talked to
+        from bleak.exc import BleakDeviceNotFoundError
 
-    async def _write(self, value):
         try:
             async with self._connection as client:
-                await client.write_gatt_char(PROP_WRITE_HANDLE - 1, value)
+                for value in values:
+                    with tracer.span("ble.write", size=len(value)):
+                        await client.write_gatt_char(PROP_WRITE_HANDLE - 1, value)
         except BleakDeviceNotFoundError:
             self._connection.lost()
             raise
 
-    async def _query(self, value):
+    async def _query(self, *values, responses=None):
+        """
+        Send requests and wait for the response to each of them
+
+        Received responses are stored in responses (request -> response).
+        """
+
+        from bleak.exc import BleakDeviceNotFoundError
+
         try:
             async with self._connection as client:
                 await client.start_notify(PROP_NTFY_HANDLE - 1, self._on_notify)
-                await client.write_gatt_char(PROP_WRITE_HANDLE - 1, value)
 
-                await asyncio.wait([self._event.wait()], timeout=15)
+                for value in values:
+                    # wait for the response to this specific request
+                    self._response = asyncio.get_running_loop().create_future()
+                    self._expected = RESPONSES.get(value[0])
+                    with tracer.span("ble.write", size=len(value)):
+                        await client.write_gatt_char(PROP_WRITE_HANDLE - 1, value)
+
+                    # timeouts are recorded as errors of the span
+                    with suppress(asyncio.TimeoutError), tracer.span("ble.notify"):
+                        # asyncio.wait_for (python 3.11 and below) drops a
+                        # cancellation that arrives together with the response
+                        await asyncio.wait([self._response], timeout=NOTIFY_TIMEOUT)
+                        if not self._response.done():
+                            raise asyncio.TimeoutError()
+
+                        if responses is not None:
+                            responses[value] = self._response.result()
         except BleakDeviceNotFoundError:
             self._connection.lost()
             raise
+        finally:
+            self._response = None
+            self._expected = None
 
     async def setup(self):
 
@@ -132,10 +289,16 @@ class Device(HassMqttDevice, RetryMixin, AvailabilityMixin, PairMixin):
             "modes": ["off", "heat", "auto"],
             # "preset_modes": ["boost"],
             "temperature_command_topic": "~/temperature_set",
-            "temperature_state_topic": "~/temperature_state",
+            "temperature_state_topic": "~/state",
+            "temperature_state_template": "{{ value_json.temperature }}",
             "mode_command_topic": "~/mode_set",
-            "mode_state_topic": "~/mode_state",
-            "availability_topic": "~/available",
+            "mode_state_topic": "~/state",
+            "mode_state_template": "{{ value_json.mode }}",
+            "action_topic": "~/state",
+            "action_template": "{{ value_json.action }}",
+            "json_attributes_topic": "~/state",
+            "availability_topic": "~/state",
+            "availability_template": "{{ value_json.available }}",
             "payload_available": "True",
             "payload_not_available": "False",
             "min_temp": EQ3BT_MIN_TEMP,
@@ -144,72 +307,107 @@ class Device(HassMqttDevice, RetryMixin, AvailabilityMixin, PairMixin):
         }
 
         await self._mqtt.publish(self, "config", message, retain=True)
+
+        # republish last known state
+        if self._published:
+            await self._mqtt.publish(self, "state", self._published, retain=True)
+            await self._publish_schedule()
+
         await self._pull()
 
-        self._ready.set()
+        # replay pending commands
+        if self._state.get_patch():
+            await self._push()
 
-    async def poll(self):
-        if self._polling is None:
-            logging.info(f"{self} not polling")
-            return
+        self._ready = True
 
-        await self._ready.wait()
-        logging.info(f"{self} polling every {self._polling}s")
+    async def remove(self):
+        await self._mqtt.publish(self, "state", "", retain=True)
+        await self._mqtt.publish(self, "schedule_state", "", retain=True)
+        await super().remove()
 
-        while True:
-            # ensure sleep problems are propagated
-            await asyncio.sleep(self._polling)
+    async def poll(self):
+        # wait until discovery is sent and the initial state is pulled
+        if not self._ready:
+            return
 
-            try:
-                logging.debug(f"{self} polling new state")
+        try:
+            logging.debug(f"{self} polling new state")
+            with tracer.trace("device.poll", device=self._id):
                 await self._pull()
                 await self._push()
 
-            except asyncio.CancelledError:
-                # graceful exit
-                return
-            except:
-                # suppress error and continue polling
-                logging.exception(f"Exception in polling loop")
+        except asyncio.CancelledError:
+            # ensure cancellation is not swallowed
+            raise
+        except:
+            # suppress error and continue polling
+            logging.exception(f"Exception while polling {self}")
 
     async def _pull(self):
         """
         Pull remote state from device
         """
 
-        # generate message
-        self._thermostat.update()
+        # generate message (also sets the clock of the device)
+        now = datetime.now()
+        message = struct.pack(
+            "BBBBBBB",
+            PROP_INFO_QUERY,
+            now.year % 100,
+            now.month,
+            now.day,
+            now.hour,
+            now.minute,
+            now.second,
+        )
         # send message
+        responses = {}
+        start = time.perf_counter()
         success = await self._retry(
             self._query,
             f"Update {self}",
             raise_exception=False,
-            args=[self._message],
+            args=[message],
+            kwargs={"responses": responses},
         )
+        latency = (time.perf_counter() - start) * 1e3 if success else None
 
         self.set_availability(success)
 
         # merge retrieved state
-        if success:
+        response = responses.get(message)
+        if response is not None:
+            self._status_frame = response
+
+            thermostat = self._protocol()
             self._state.merge_remote(
                 {
-                    "temperature": self._thermostat.target_temperature,
-                    "mode": self._thermostat.mode,
+                    "temperature": thermostat.target_temperature,
+                    "mode": thermostat.mode,
                 }
             )
 
+        self._record(latency)
+
         # publish new state to Home Assistant
         await self._publish_device_state()
 
+        # keep cached schedule in sync
+        if success and self._schedule_sync_enabled:
+            await self._schedule_sync()
+
     async def _push(self):
         patch = self._state.get_patch()
         temperature = patch.get("temperature")
         mode = patch.get("mode")
         success = True
+        start = time.perf_counter()
+        thermostat = self._protocol()
 
         if temperature is not None:
             # generate message
-            self._thermostat.target_temperature = temperature
+            thermostat.target_temperature = temperature
             # send message
             success = (
                 await self._retry(
@@ -223,7 +421,7 @@ class Device(HassMqttDevice, RetryMixin, AvailabilityMixin, PairMixin):
 
         if mode is not None:
             # generate message
-            self._thermostat.mode = mode
+            thermostat.mode = mode
             # send message
             success = (
                 await self._retry(
@@ -240,14 +438,20 @@ class Device(HassMqttDevice, RetryMixin, AvailabilityMixin, PairMixin):
         if success:
             self._state.merge_remote(
                 {
-                    "temperature": self._thermostat.target_temperature,
-                    "mode": self._thermostat.mode,
+                    "temperature": thermostat.target_temperature,
+                    "mode": thermostat.mode,
                 }
             )
 
+        if patch:
+            latency = (time.perf_counter() - start) * 1e3 if success else None
+            self._record(latency)
+
         # publish new state to Home Assistant
         await self._publish_device_state()
 
+        return success
+
     async def _mqtt_temperature_set(self, temperature):
         temperature = float(temperature)
 
@@ -258,9 +462,10 @@ class Device(HassMqttDevice, RetryMixin, AvailabilityMixin, PairMixin):
                 "temperature": temperature,
             }
         )
+        self._checkpoint()
 
         # push device state
-        await self._push()
+        return await self._push()
 
     async def _mqtt_mode_set(self, mode):
         if mode == "off":
@@ -271,32 +476,129 @@ class Device(HassMqttDevice, RetryMixin, AvailabilityMixin, PairMixin):
             self._state.push_local({"mode": Mode.Auto})
         else:
             raise Exception("Unknown mode")
+        self._checkpoint()
 
         # push device state
-        await self._push()
+        return await self._push()
+
+    async def _mqtt_history_get(self, payload):
+        request = json.loads(payload) if payload else {}
+        history = self.history(request.get("since"), request.get("points"))
+
+        await self._mqtt.publish(self, "history", history)
+
+    def status(self):
+        return dict(self._published)
+
+    def history(self, since=None, points=None):
+        history = self._history.query(since, points)
+
+        history["mode"] = [
+            None if mode is None else Mode(mode).name.lower()
+            for mode in history["mode"]
+        ]
+        history["available"] = [
+            None if available is None else bool(available)
+            for available in history["available"]
+        ]
+        return history
+
+    def _record(self, latency):
+        """
+        Add the confirmed device state to the history
+        """
+
+        temperature = self._state.remote("temperature")
+        mode = self._state.remote("mode")
+        valve = None
+        if latency is not None and self._status_frame is not None:
+            valve = self._status_frame[STATUS_VALVE]
+
+        self._history.record(
+            temperature=None if temperature in (None, Mode.Unknown) else temperature,
+            mode=mode if mode != Mode.Unknown else None,
+            valve=valve,
+            available=self._availability > 0,
+            latency=latency,
+        )
+
+    def _status(self):
+        """
+        Collect everything decoded from the last status response
+        """
+
+        thermostat = self._protocol()
+        away_end = thermostat.away_end
+        window_open_time = thermostat.window_open_time
+
+        return {
+            "valve": thermostat.valve_state,
+            "window_open": bool(thermostat.window_open),
+            "boost": thermostat.mode == Mode.Boost,
+            "away": thermostat.mode == Mode.Away,
+            "away_end": away_end.isoformat() if away_end else None,
+            "locked": bool(thermostat.locked),
+            "low_battery": bool(thermostat.low_battery),
+            "comfort_temperature": thermostat.comfort_temperature,
+            "eco_temperature": thermostat.eco_temperature,
+            "window_open_temperature": thermostat.window_open_temperature,
+            "window_open_time": (
+                window_open_time.seconds // 60 if window_open_time else None
+            ),
+            "temperature_offset": thermostat.temperature_offset,
+        }
 
     async def _publish_device_state(self):
+        """
+        Publish the consolidated device state as a single retained message
+        """
 
         # optimistic updates (use local state)
         temperature = self._state.local("temperature")
         mode = self._state.local("mode")
 
+        state = dict(self._published)
+
         if (
             not self._availability
-            or temperature == Mode.Unknown
-            or mode == Mode.Unknown
+            or temperature in (None, Mode.Unknown)
+            or mode in (None, Mode.Unknown)
         ):
-            # deny availability
-            await self._mqtt.publish(self, "available", False, retain=True)
+            # deny availability but keep last known values
+            state["available"] = False
+
+        else:
+            # restored values are kept until the device reported its status
+            if self._status_frame is not None:
+                state.update(self._status())
+            state.update(
+                {
+                    "available": True,
+                    "mode": MODES[mode],
+                    "temperature": temperature,
+                }
+            )
+
+            action = self._action(mode, state.get("valve"))
+            if action is not None:
+                state["action"] = action
+
+        # skip redundant messages
+        if state == self._published:
+            self._checkpoint()
             return
 
-        # translate mode
+        self._published = state
+        self._checkpoint()
+
+        await self._mqtt.publish(self, "state", state, retain=True)
+
+    @staticmethod
+    def _action(mode, valve):
         if mode == Mode.Closed:
-            await self._mqtt.publish(self, "mode_state", "off", retain=True)
-        if mode == Mode.Auto:
-            await self._mqtt.publish(self, "mode_state", "auto", retain=True)
-        if mode in [Mode.Boost, Mode.Open, Mode.Manual]:
-            await self._mqtt.publish(self, "mode_state", "heat", retain=True)
-
-        await self._mqtt.publish(self, "temperature_state", temperature, retain=True)
-        await self._mqtt.publish(self, "available", True, retain=True)
+            return "off"
+        if valve is None or valve == Mode.Unknown:
+            return None
+        if valve:
+            return "heating"
+        return "idle"
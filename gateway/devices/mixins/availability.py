@@ -2,6 +2,8 @@ import logging
 
 
 class AvailabilityMixin:
+    __slots__ = ()
+
     def set_availability(self, value):
         """
         Update the device availability
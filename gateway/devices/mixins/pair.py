@@ -1,14 +1,26 @@
+import asyncio
 import logging
-import pexpect
 import sys
 
 
 class PairMixin:
+    __slots__ = ()
+
     async def _bluetooth_ctl_pair(self):
         """
         Hacky method to automatically pair a device
+
+        bluetoothctl is driven synchronously, so it runs in a worker thread to keep
+        the event loop responsive.
         """
 
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._bluetooth_ctl_pair_blocking)
+
+    def _bluetooth_ctl_pair_blocking(self):
+        # only required if devices need pairing
+        import pexpect
+
         p = pexpect.spawn("bluetoothctl", encoding="utf-8")
 
         if logging.getLogger().level <= logging.DEBUG:
@@ -1,8 +1,12 @@
 import logging
 import asyncio
 
+from tools import tracer
+
 
 class RetryMixin:
+    __slots__ = ()
+
     async def _retry(
         self,
         callback,
@@ -21,7 +25,8 @@ class RetryMixin:
 
         for i in range(retries):
             try:
-                await callback(*args, **kwargs)
+                with tracer.span("retry", log=log, attempt=i):
+                    await callback(*args, **kwargs)
                 logging.info(f"{log} succeeded")
                 return True
             except asyncio.CancelledError:
@@ -0,0 +1,285 @@
+import json
+import logging
+import struct
+import zlib
+
+from datetime import datetime, time, timedelta
+
+from eq3bt.eq3btsmart import Mode, PROP_SCHEDULE_QUERY
+from eq3bt.structures import Schedule, NAME_TO_DAY, HOUR_24_PLACEHOLDER
+
+
+# weekday names indexed by datetime.weekday()
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+# delay before days the device did not answer are queried again (doubled up to max)
+RETRY_DELAY = timedelta(minutes=10)
+RETRY_DELAY_MAX = timedelta(days=1)
+
+
+class ScheduleMixin:
+    """
+    Cached weekly schedule of an eQ-3 thermostat
+
+    Each day is cached together with a hash of its program. Days are only queried
+    again if the observed device state does not match the cached program, and only
+    the days that differ are written to the device.
+    """
+
+    __slots__ = ()
+
+    def _schedule_init(self):
+        # day name -> (hash, periods)
+        self._schedule = {}
+        self._schedule_version = 0
+        self._schedule_checked = None
+        # (next attempt, delay) while the device does not answer schedule queries
+        self._schedule_retry = None
+
+    @staticmethod
+    def _schedule_hash(periods):
+        return f"{zlib.crc32(json.dumps(periods).encode()):08x}"
+
+    @staticmethod
+    def _schedule_periods(parsed):
+        """
+        Translate a parsed schedule frame into a list of periods
+        """
+
+        periods = []
+        entries = [(parsed.base_temp, parsed.next_change_at)]
+        entries += [(hour.target_temp, hour.next_change_at) for hour in parsed.hours]
+
+        for temperature, until in entries:
+            if until == HOUR_24_PLACEHOLDER:
+                periods.append({"temperature": temperature, "until": "24:00"})
+                break
+
+            periods.append(
+                {"temperature": temperature, "until": until.strftime("%H:%M")}
+            )
+
+        return periods
+
+    @staticmethod
+    def _schedule_normalize(day, periods):
+        """
+        Bring user supplied periods into the resolution of the device
+        """
+
+        normalized = []
+        for period in periods:
+            until = period["until"]
+            if until != "24:00":
+                until = datetime.strptime(until, "%H:%M")
+                until = f"{until.hour:02d}:{until.minute - until.minute % 10:02d}"
+
+            temperature = round(float(period["temperature"]) * 2) / 2
+            normalized.append({"temperature": temperature, "until": until})
+
+        if not normalized or normalized[-1]["until"] != "24:00":
+            raise Exception(f"Schedule for {day} must end at 24:00")
+        if len(normalized) > 7:
+            raise Exception(f"Schedule for {day} exceeds 7 periods")
+
+        return normalized
+
+    @staticmethod
+    def _schedule_frame(day, periods):
+        """
+        Build the frame to write a list of normalized periods for a single day
+        """
+
+        entries = []
+        for period in periods:
+            until = period["until"]
+            if until == "24:00":
+                until = HOUR_24_PLACEHOLDER
+            else:
+                until = time.fromisoformat(until)
+
+            entries.append(
+                {"target_temp": period["temperature"], "next_change_at": until}
+            )
+
+        return Schedule.build(
+            {
+                "cmd": "write",
+                "day": day,
+                "base_temp": entries[0]["target_temp"],
+                "next_change_at": entries[0]["next_change_at"],
+                "hours": entries[1:],
+            }
+        )
+
+    def _schedule_update(self, day, periods):
+        """
+        Update a cached day, returns True if the program changed
+        """
+
+        digest = self._schedule_hash(periods)
+        cached = self._schedule.get(day)
+        if cached is not None and cached[0] == digest:
+            return False
+
+        self._schedule[day] = (digest, periods)
+        self._schedule_version += 1
+        return True
+
+    def _schedule_expected(self, now):
+        """
+        Get the target temperature the cached program expects right now
+        """
+
+        cached = self._schedule.get(WEEKDAYS[now.weekday()])
+        if cached is None:
+            return None
+
+        current = now.strftime("%H:%M")
+        for period in cached[1]:
+            if current < period["until"]:
+                return period["temperature"]
+
+        return None
+
+    async def _schedule_query(self, days):
+        """
+        Query the given days from the device using a single connection
+        """
+
+        messages = {
+            day: struct.pack("BB", PROP_SCHEDULE_QUERY, NAME_TO_DAY[day])
+            for day in days
+        }
+        responses = {}
+
+        await self._retry(
+            self._query,
+            f"Query schedule {', '.join(days)} on {self}",
+            raise_exception=False,
+            args=list(messages.values()),
+            kwargs={"responses": responses},
+        )
+
+        changed = []
+        for day, message in messages.items():
+            response = responses.get(message)
+            if response is None:
+                continue
+
+            parsed = Schedule.parse(response)
+            if self._schedule_update(day, self._schedule_periods(parsed)):
+                changed.append(day)
+
+        return changed
+
+    async def _schedule_sync(self):
+        """
+        Re-query the schedule if the device state suggests it changed
+        """
+
+        # initially load all days once
+        missing = [day for day in NAME_TO_DAY if day not in self._schedule]
+        if missing:
+            retry = self._schedule_retry
+            if retry is not None and datetime.now() < retry[0]:
+                return
+
+            await self._schedule_query(missing)
+            await self._publish_schedule()
+
+            # back off if the device does not answer schedule queries
+            if any(day not in self._schedule for day in missing):
+                delay = min(retry[1] * 2, RETRY_DELAY_MAX) if retry else RETRY_DELAY
+                self._schedule_retry = (datetime.now() + delay, delay)
+                logging.warning(
+                    f"{self} did not return its schedule, retrying in {delay}"
+                )
+            else:
+                self._schedule_retry = None
+            return
+
+        thermostat = self._protocol()
+        if thermostat.mode != Mode.Auto or thermostat.window_open:
+            return
+
+        now = datetime.now()
+        today = WEEKDAYS[now.weekday()]
+        target = thermostat.target_temperature
+        expected = self._schedule_expected(now)
+
+        # only check each deviation once
+        if expected is None or expected == target:
+            return
+        if self._schedule_checked == (today, target):
+            return
+        self._schedule_checked = (today, target)
+
+        logging.info(f"{self} schedule expects {expected}, device reports {target}")
+
+        # assume the whole week was reprogrammed if today changed
+        if await self._schedule_query([today]):
+            others = [day for day in NAME_TO_DAY if day != today]
+            await self._schedule_query(others)
+
+        await self._publish_schedule()
+
+    async def _publish_schedule(self):
+        message = {
+            "version": self._schedule_version,
+            "days": {
+                day: {"hash": digest, "periods": periods}
+                for day, (digest, periods) in self._schedule.items()
+            },
+        }
+
+        await self._mqtt.publish(self, "schedule_state", message, retain=True)
+        self._checkpoint()
+
+    async def _mqtt_schedule_get(self, payload):
+        days = list(NAME_TO_DAY)
+        if payload:
+            requested = json.loads(payload)
+            if not isinstance(requested, list):
+                requested = []
+            days = [day for day in requested if isinstance(day, str)]
+            days = [day for day in days if day in NAME_TO_DAY]
+
+        # nothing to query if no known day was requested
+        if not days:
+            logging.warning(f"{self} ignores schedule request without a known day")
+            return
+
+        await self._schedule_query(days)
+        await self._publish_schedule()
+
+    async def _mqtt_schedule_set(self, payload):
+        program = json.loads(payload)
+
+        # only send frames for days that differ
+        frames = {}
+        for day, periods in program.items():
+            if day not in NAME_TO_DAY:
+                raise Exception(f"Unknown day {day}")
+
+            periods = self._schedule_normalize(day, periods)
+            cached = self._schedule.get(day)
+            if cached is None or cached[0] != self._schedule_hash(periods):
+                frames[day] = (self._schedule_frame(day, periods), periods)
+
+        if not frames:
+            logging.info(f"{self} schedule unchanged")
+            return
+
+        success = await self._retry(
+            self._write,
+            f"Set schedule {', '.join(frames)} on {self}",
+            raise_exception=False,
+            args=[frame for frame, _ in frames.values()],
+        )
+
+        if success:
+            for day, (_, periods) in frames.items():
+                self._schedule_update(day, periods)
+
+        await self._publish_schedule()
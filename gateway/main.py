@@ -1,50 +1,338 @@
 import argparse
 import asyncio
-import importlib
 import logging
+import os
+import signal
 
 from contextlib import AsyncExitStack, suppress
 
-from mqtt import HassMqttMessenger
-from ble import BleManager
+from mqtt import HassMqttMessenger, HassMqttCluster
+from ble import BleManager, Recorder, ReplayBleManager
+from zones import Zone
+from devices import load_module
 
-from tools import Tasks
+from tools import Tasks, wait_event
 from tools import Config
+from tools import Snapshot
+from tools import Poller
+from tools import LoopMonitor
+from tools import Profiler
+from tools import tracer, FileExporter, OtlpExporter
 
 
 logging.basicConfig(level=logging.WARNING)
 
 
+class Gateway:
+    """
+    Runs all configured devices and zones
+
+    The configuration file is watched for changes. On reload, only devices and
+    zones whose configuration changed are restarted, all others keep running.
+    If a cluster is configured, devices are started and stopped by the cluster.
+    """
+
+    def __init__(self, filename, tasks, mqtt, ble, snapshot=None, monitor=None):
+        self._filename = filename
+        self._tasks = tasks
+        self._mqtt = mqtt
+        self._ble = ble
+        self._snapshot = snapshot
+        self._monitor = monitor
+        self._profiler = Profiler()
+        self._poller = Poller()
+
+        # id -> (config data, device or zone, tasks)
+        self._devices = {}
+        self._zones = {}
+        self._configured = {}
+        self._cluster = None
+
+        self._mtime = None
+        self._reload = asyncio.Event()
+
+    @property
+    def configured(self):
+        return self._configured
+
+    @property
+    def running(self):
+        return self._devices.keys()
+
+    def _stat(self):
+        with suppress(OSError):
+            return os.stat(self._filename).st_mtime_ns
+
+    async def start_device(self, id, device_data):
+        device_config = Config(config=device_data)
+        module_name = device_config.require("module")
+
+        module = load_module(module_name)
+        device = module.Device(id, device_config, self._mqtt, self._ble, self._snapshot)
+        self._mqtt.register(device)
+
+        # device specific setup if required
+        await device.setup()
+
+        self._devices[id] = (
+            device_data,
+            device,
+            [self._tasks.spawn(device.listen(), f"device {device}")],
+        )
+        self._poller.add(device)
+
+    async def stop_device(self, id, remove=False):
+        _, device, tasks = self._devices.pop(id)
+        await self._poller.remove(device)
+        await self._tasks.cancel(*tasks)
+
+        # device is no longer configured
+        if remove:
+            try:
+                await device.remove()
+            except:
+                logging.exception(f"Failed to remove {device} from Home Assistant")
+
+        self._mqtt.unregister(device)
+        if device.connection is not None:
+            self._ble.unregister(device.connection)
+
+        logging.info(f"Stopped {device}")
+
+    def start_zone(self, id, zone_data):
+        # zones of a cluster only handle the members driven by this instance
+        instance = self._cluster.instance if self._cluster is not None else None
+
+        zone = Zone(
+            id, Config(config=zone_data), self._mqtt, self._ble, instance=instance
+        )
+        self._zones[id] = (
+            zone_data,
+            zone,
+            [self._tasks.spawn(zone.listen(), f"{zone}")],
+        )
+
+    async def stop_zone(self, id):
+        _, zone, tasks = self._zones.pop(id)
+        await self._tasks.cancel(*tasks)
+
+    async def start(self):
+        self._mtime = self._stat()
+        config = Config(self._filename)
+        self._configured = config.require("devices")
+
+        # poll all devices from a single task
+        self._tasks.spawn(self._poller.run(), "polling devices")
+
+        # devices are assigned by the cluster
+        if config.optional("cluster") is not None:
+            self._cluster = HassMqttCluster(
+                Config(config=config.require("cluster")), self._mqtt, self._ble, self
+            )
+            self._tasks.spawn(self._cluster.run(), f"{self._cluster}")
+
+        # spawn task for every device
+        else:
+            for id, device_data in self._configured.items():
+                try:
+                    await self.start_device(id, device_data)
+                except:
+                    logging.exception(f"Failed to start {id}")
+                    raise
+
+        # spawn task for every zone
+        for id, zone_data in config.optional("zones", {}).items():
+            self.start_zone(id, zone_data)
+
+    async def reload(self):
+        """
+        Apply configuration changes incrementally
+        """
+
+        self._mtime = self._stat()
+        config = Config(self._filename)
+        logging.info("Reloading config...")
+
+        devices = config.require("devices")
+        zones = config.optional("zones", {})
+        self._configured = devices
+
+        # stop removed or changed devices and zones
+        for id, (data, *_) in list(self._devices.items()):
+            if devices.get(id) != data:
+                await self.stop_device(id, remove=id not in devices)
+            if id not in devices and self._snapshot is not None:
+                self._snapshot.remove(id)
+        for id, (data, *_) in list(self._zones.items()):
+            if zones.get(id) != data:
+                await self.stop_zone(id)
+
+        # start added or changed devices and zones
+        if self._cluster is not None:
+            await self._cluster.reconcile()
+        else:
+            for id, device_data in devices.items():
+                if id in self._devices:
+                    continue
+                try:
+                    await self.start_device(id, device_data)
+                except:
+                    logging.exception(f"Failed to start {id}")
+
+        for id, zone_data in zones.items():
+            if id not in self._zones:
+                self.start_zone(id, zone_data)
+
+        logging.info(
+            f"Config reloaded ({len(self._devices)} devices, {len(self._zones)} zones)"
+        )
+
+    async def watch(self, interval):
+        """
+        Reload on config file changes or SIGHUP
+        """
+
+        with suppress(NotImplementedError):
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGHUP, self._reload.set
+            )
+
+        while True:
+            await wait_event(self._reload, interval)
+
+            if not self._reload.is_set() and self._stat() == self._mtime:
+                continue
+            self._reload.clear()
+
+            try:
+                await self.reload()
+            except asyncio.CancelledError:
+                raise
+            except:
+                # keep running with the previous configuration
+                logging.exception("Failed to reload config")
+
+    async def profile(self, duration, filename):
+        """
+        Profile the gateway and publish a summary of the slowest coroutines
+        """
+
+        try:
+            result = await self._profiler.profile(duration, filename)
+        except asyncio.CancelledError:
+            raise
+        except:
+            # profiling must never stop the gateway
+            logging.exception("Failed to profile the gateway")
+            return
+
+        await self._mqtt.publish_gateway(
+            "profile_state",
+            {"file": filename, "coroutines": result["coroutines"][:10]},
+        )
+
+    async def listen(self, filename):
+        """
+        Listen for commands addressed to the gateway
+        """
+
+        async with self._mqtt.gateway_messages() as messages:
+            async for message in messages:
+                command = message.topic.split("/")[-1]
+
+                try:
+                    payload = message.payload.decode() if message.payload else ""
+
+                    if command == "profile":
+                        if self._profiler.running:
+                            logging.warning("Profiler already running")
+                            continue
+
+                        duration = float(payload or 10)
+                        self._tasks.spawn(self.profile(duration, filename), "profiling")
+
+                    elif command == "monitor" and self._monitor is not None:
+                        await self._mqtt.publish_gateway(
+                            "monitor_state",
+                            {
+                                "max_lag": round(self._monitor.max_lag, 3),
+                                "events": self._monitor.events,
+                            },
+                        )
+                except asyncio.CancelledError:
+                    # ensure cancellation is not swallowed
+                    raise
+                except:
+                    logging.exception(f"Failed to handle gateway command {command}")
+
+
 async def run(args):
     async with AsyncExitStack() as stack:
 
         # load config
         config = Config(args.config)
 
+        # trace commands from MQTT down to BLE
+        if config.optional("tracing.file"):
+            tracer.configure(
+                FileExporter(
+                    config.require("tracing.file"),
+                    max_bytes=config.optional("tracing.max_bytes", 1048576),
+                    backups=config.optional("tracing.backups", 3),
+                )
+            )
+        elif config.optional("tracing.otlp"):
+            tracer.configure(OtlpExporter(config.require("tracing.otlp")))
+
         # initialize BLE connection manager
-        ble = BleManager()
+        if args.replay:
+            ble = ReplayBleManager(args.replay, speed=args.replay_speed)
+        elif args.record:
+            ble = BleManager(stack.enter_context(Recorder(args.record)))
+        else:
+            ble = BleManager()
+
+        # restore last known device state (written on shutdown)
+        snapshot = None
+        filename = config.optional(
+            "snapshot", os.path.join(os.path.dirname(args.config), "state.json")
+        )
+        if filename:
+            snapshot = stack.enter_context(Snapshot(filename))
 
         # connect to broker
         tasks = await stack.enter_async_context(Tasks())
         mqtt = await stack.enter_async_context(HassMqttMessenger(config))
 
-        # spawn task for every device
-        devices = config.require("devices")
-        for id, device_data in devices.items():
-            device_config = Config(config=device_data)
-            module_name = device_config.require("module")
-            try:
-                module = importlib.import_module(f"devices.{module_name}")
-                device = module.Device(id, device_config, mqtt, ble)
+        # detect callbacks that block the event loop
+        monitor = None
+        threshold = config.optional("monitor.threshold", 0.5)
+        if threshold:
+            monitor = LoopMonitor(threshold=threshold)
+            tasks.spawn(monitor.run(), "monitoring event loop")
 
-                # device specific setup if required
-                await device.setup()
+        gateway = Gateway(args.config, tasks, mqtt, ble, snapshot, monitor)
+        tasks.spawn(gateway.listen(args.profile_output), "gateway commands")
 
-                tasks.spawn(device.listen(), f"device {device}")
-                tasks.spawn(device.poll(), f"polling {device}")
-            except:
-                logging.exception(f"Failed to module {module_name} for {id}")
-                return
+        # serve local control API
+        if config.optional("api") is not None:
+            # imported lazily to keep startup fast
+            from api import LocalApi
+
+            api = LocalApi(Config(config=config.require("api")), mqtt, ble)
+            tasks.spawn(api.run(), f"{api}")
+        if args.profile:
+            tasks.spawn(gateway.profile(args.profile, args.profile_output), "profiling")
+
+        try:
+            await gateway.start()
+        except:
+            return
+
+        # watch config for changes
+        interval = config.optional("reload", 10)
+        if interval:
+            tasks.spawn(gateway.watch(interval), "watching config")
 
         # wait for all tasks
         await tasks.gather()
@@ -53,6 +341,11 @@ async def run(args):
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", default="./config.yaml")
+    parser.add_argument("--profile", type=float, help="profile for N seconds")
+    parser.add_argument("--profile-output", default="./profile.json")
+    parser.add_argument("--record", help="record BLE traffic to a capture file")
+    parser.add_argument("--replay", help="replay BLE traffic from a capture file")
+    parser.add_argument("--replay-speed", type=float, default=1.0)
     args = parser.parse_args()
 
     # run application
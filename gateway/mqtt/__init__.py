@@ -1,2 +1,3 @@
 from .messenger import HassMqttMessenger
 from .device import HassMqttDevice
+from .cluster import HassMqttCluster
@@ -0,0 +1,260 @@
+import json
+import logging
+import asyncio
+import time
+
+from contextlib import suppress
+
+from tools import wait_event
+
+
+# signal strength assumed for devices an instance cannot see
+RSSI_UNKNOWN = -255
+
+
+def assign(devices, members, load_penalty=5):
+    """
+    Deterministically assign devices to gateway instances
+
+    Every instance computes the same assignment from the same membership view.
+    Devices go to the instance with the best signal, penalized by the number of
+    devices already assigned to that instance.
+    """
+
+    load = {instance: 0 for instance in members}
+    assignment = {}
+
+    if not members:
+        return assignment
+
+    for id in sorted(devices):
+
+        def score(instance):
+            rssi = members[instance]["rssi"].get(id)
+            if rssi is None:
+                rssi = RSSI_UNKNOWN
+            return (rssi - load_penalty * load[instance], instance)
+
+        instance = max(members, key=score)
+        assignment[id] = instance
+        load[instance] += 1
+
+    return assignment
+
+
+class HassMqttCluster:
+    """
+    Shares the configured devices between several gateway instances
+
+    Instances announce themselves with a retained heartbeat that includes the
+    signal strength of every configured device. Devices are assigned by signal
+    strength and load. An instance only drives a device after it holds the
+    retained claim of that device, so each device is driven by one instance.
+
+    Claims are plain retained messages, so two instances may claim the same device
+    at the same time and the last claim wins. An instance therefore only starts a
+    device once its claim was held for a settle period, long enough to receive a
+    concurrent claim. Claims of another instance are only taken over once that
+    instance left (its member topic was cleared) or missed three heartbeats.
+    Devices may still be driven twice if a claim is delayed by more than the
+    settle period, or if an instance keeps running while it misses heartbeats.
+    """
+
+    def __init__(self, config, mqtt, ble, gateway):
+        self._mqtt = mqtt
+        self._ble = ble
+        self._gateway = gateway
+
+        self._instance = config.require("instance")
+        self._interval = config.optional("heartbeat", 10)
+        self._load_penalty = config.optional("load_penalty", 5)
+        self._settle = config.optional("settle", 1.0)
+
+        # instance -> heartbeat
+        self._members = {}
+        # device id -> instance
+        self._claims = {}
+        # device id -> time the claim of this instance was received
+        self._confirmed = {}
+
+        self._lock = asyncio.Lock()
+        self._changed = asyncio.Event()
+
+    def __str__(self):
+        return f"cluster instance {self._instance}"
+
+    @property
+    def instance(self):
+        return self._instance
+
+    def _alive(self):
+        """
+        Get all instances with a recent heartbeat
+
+        Heartbeats are timed on arrival, so clocks of the instances may differ.
+        """
+
+        deadline = time.monotonic() - 3 * self._interval
+        return {
+            instance: member
+            for instance, member in self._members.items()
+            if member["received"] >= deadline
+        }
+
+    def _heartbeat(self):
+        rssi = {}
+        for id, data in self._gateway.configured.items():
+            # devices added on reload are measured with the next scan
+            self._ble.watch(data.get("mac"))
+
+            value = self._ble.rssi(data.get("mac"))
+            if value is not None:
+                rssi[id] = value
+
+        return {
+            "time": time.time(),
+            "load": len(self._gateway.running),
+            "rssi": rssi,
+        }
+
+    async def _announce(self):
+        await self._mqtt.client.publish(
+            self._mqtt.member_topic(self._instance),
+            json.dumps(self._heartbeat()).encode(),
+            retain=True,
+        )
+
+    async def _listen(self, messages):
+        async for message in messages:
+            parts = message.topic.split("/")
+            kind, key = parts[-2], parts[-1]
+            payload = message.payload.decode() if message.payload else ""
+
+            if kind == "members":
+                if payload:
+                    member = json.loads(payload)
+                    member["received"] = time.monotonic()
+                    self._members[key] = member
+                else:
+                    self._members.pop(key, None)
+            elif kind == "claims":
+                if payload:
+                    self._claims[key] = payload
+                else:
+                    self._claims.pop(key, None)
+
+                if payload == self._instance:
+                    self._confirmed.setdefault(key, time.monotonic())
+                else:
+                    self._confirmed.pop(key, None)
+            else:
+                continue
+
+            self._changed.set()
+
+    async def _claim(self, id, instance):
+        await self._mqtt.client.publish(
+            self._mqtt.claim_topic(id), instance.encode(), retain=True
+        )
+
+    async def reconcile(self):
+        """
+        Start and stop devices according to the current assignment
+        """
+
+        async with self._lock:
+            alive = self._alive()
+            assignment = assign(
+                self._gateway.configured, alive, load_penalty=self._load_penalty
+            )
+
+            # hand over devices assigned to other instances
+            for id in list(self._gateway.running):
+                owner = self._claims.get(id)
+                if assignment.get(id) == self._instance and owner == self._instance:
+                    continue
+
+                logging.info(f"{self} hands over {id}")
+                await self._gateway.stop_device(id)
+
+                # release claim unless another instance took over already
+                if owner == self._instance:
+                    await self._claim(id, "")
+
+            # release claims confirmed after the device was reassigned
+            for id, owner in list(self._claims.items()):
+                if owner != self._instance or id in self._gateway.running:
+                    continue
+                if assignment.get(id) != self._instance:
+                    await self._claim(id, "")
+
+            for id, instance in assignment.items():
+                if instance != self._instance or id in self._gateway.running:
+                    continue
+
+                owner = self._claims.get(id)
+                if owner == self._instance:
+                    # wait for concurrent claims of other instances
+                    if time.monotonic() < self._confirmed[id] + self._settle:
+                        continue
+
+                    # claim confirmed by the broker
+                    logging.info(f"{self} takes over {id}")
+                    try:
+                        await self._gateway.start_device(
+                            id, self._gateway.configured[id]
+                        )
+                    except:
+                        logging.exception(f"Failed to start {id}")
+
+                elif owner is None or owner not in alive:
+                    await self._claim(id, self._instance)
+
+    def _wakeup(self, heartbeat):
+        """
+        Get the time of the next heartbeat or of the next claim that settles
+        """
+
+        now = time.monotonic()
+        settled = [
+            confirmed + self._settle
+            for id, confirmed in self._confirmed.items()
+            if confirmed + self._settle > now and id not in self._gateway.running
+        ]
+        return min([heartbeat] + settled)
+
+    async def run(self):
+        # measure signal strength of all configured devices
+        for data in self._gateway.configured.values():
+            self._ble.watch(data.get("mac"))
+        await self._ble.discover(measure=True)
+
+        async with self._mqtt.cluster_messages() as messages:
+            listener = asyncio.create_task(self._listen(messages))
+
+            try:
+                heartbeat = 0
+                while True:
+                    if time.monotonic() >= heartbeat:
+                        heartbeat = time.monotonic() + self._interval
+                        await self._announce()
+
+                    # react to membership and claim changes immediately
+                    self._changed.clear()
+                    timeout = max(0, self._wakeup(heartbeat) - time.monotonic())
+                    if await wait_event(self._changed, timeout):
+                        # collect bursts of retained messages
+                        await asyncio.sleep(0.5)
+
+                    await self.reconcile()
+
+            finally:
+                listener.cancel()
+
+                # leave gracefully if the broker is still connected
+                with suppress(Exception):
+                    for id in list(self._gateway.running):
+                        await self._claim(id, "")
+                    await self._mqtt.client.publish(
+                        self._mqtt.member_topic(self._instance), b"", retain=True
+                    )
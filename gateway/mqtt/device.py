@@ -2,13 +2,18 @@ import json
 import logging
 import asyncio
 
+from tools import tracer
+
 
 class HassMqttDevice:
-    def __init__(self, id, config, mqtt, ble):
+    __slots__ = ("_id", "_config", "_mqtt", "_ble", "_snapshot")
+
+    def __init__(self, id, config, mqtt, ble, snapshot=None):
         self._id = id
         self._config = config
         self._mqtt = mqtt
         self._ble = ble
+        self._snapshot = snapshot
 
     def __str__(self):
         return f"{self._id} ({self._config.optional('mac')})"
@@ -21,6 +26,40 @@ class HassMqttDevice:
     def component(self):
         return None
 
+    @property
+    def connection(self):
+        return None
+
+    @property
+    def poll_interval(self):
+        """
+        Seconds between two polls (None disables polling)
+        """
+        return None
+
+    def status(self):
+        """
+        Get the last known device state
+        """
+        return {}
+
+    def history(self, since=None, points=None):
+        """
+        Get recent device state samples
+        """
+        return {}
+
+    async def command(self, command, payload):
+        """
+        Handle a command as if it was received via MQTT
+        """
+
+        handler = getattr(self, f"_mqtt_{command}", None)
+        if handler is None:
+            raise Exception(f"Unknown command {command}")
+
+        return await handler(payload)
+
     async def listen(self):
         """
         Listen for incoming messages
@@ -33,7 +72,7 @@ class HassMqttDevice:
         async with self._mqtt.filtered_messages(self) as messages:
             async for message in messages:
                 logging.debug(
-                    f"Received message on {message.topic}:\n{message.payload}"
+                    "Received message on %s:\n%s", message.topic, message.payload
                 )
 
                 # get command from topic and load message
@@ -52,7 +91,8 @@ class HassMqttDevice:
                         # TODO: let device specify message format (i.e. JSON)
                         payload = message.payload.decode()
 
-                    await handler(payload)
+                    with tracer.trace("mqtt.command", device=self._id, command=command):
+                        await handler(payload)
                 except asyncio.CancelledError:
                     # ensure cancellation is not swallowed
                     raise
@@ -62,7 +102,7 @@ class HassMqttDevice:
 
     async def poll(self):
         """
-        Implement polling
+        Poll the device once
         """
         pass
 
@@ -77,3 +117,9 @@ class HassMqttDevice:
         Send discovery message
         """
         pass
+
+    async def remove(self):
+        """
+        Remove the device from Home Assistant by clearing retained messages
+        """
+        await self._mqtt.publish(self, "config", "", retain=True)
@@ -1,7 +1,7 @@
 import json
 
-from asyncio_mqtt.client import Client
-from contextlib import AsyncExitStack
+from asyncio_mqtt.client import Client, Will
+from contextlib import AsyncExitStack, asynccontextmanager
 
 from tools import Tasks
 
@@ -17,16 +17,25 @@ class HassMqttMessenger:
         self._devices = {}
         self._paths = {}
 
+        self._topic = config.optional("mqtt.topic", "eq3bt")
+        self._instance = config.optional("cluster.instance")
+
+        # leave the cluster if the connection is lost
+        will = None
+        if self._instance is not None:
+            will = Will(self.member_topic(self._instance), b"", retain=True)
+
         self._client = Client(
             self._config.require("mqtt.broker"),
             username=self._config.optional("mqtt.username"),
             password=self._config.optional("mqtt.password"),
+            will=will,
         )
-        self._topic = config.optional("mqtt.topic", "eq3bt")
 
     async def __aenter__(self):
         await self._client.__aenter__()
         await self._client.subscribe("homeassistant/#")
+        await self._client.subscribe(f"{self._topic}/gateway/#")
 
         return self
 
@@ -47,12 +56,72 @@ class HassMqttMessenger:
         """
         self._devices[device.id] = device
 
+    def unregister(self, device):
+        """
+        Unregister a device
+        """
+        self._devices.pop(device.id, None)
+
+    @property
+    def devices(self):
+        return self._devices
+
+    def device(self, id):
+        """
+        Get a registered device
+        """
+        return self._devices.get(id)
+
     def device_topic(self, device):
         """
         Return base topic for a specific device
         """
         return f"homeassistant/{device.component}/{self._topic}/{device.id}"
 
+    def member_topic(self, instance):
+        """
+        Return topic announcing a gateway instance
+        """
+        return f"{self._topic}/cluster/members/{instance}"
+
+    def claim_topic(self, id):
+        """
+        Return topic holding the instance that drives a device
+        """
+        return f"{self._topic}/cluster/claims/{id}"
+
+    def gateway_messages(self):
+        """
+        Shorthand to get commands addressed to the gateway itself
+        """
+        return self._client.filtered_messages(f"{self._topic}/gateway/#")
+
+    async def publish_gateway(self, topic, message, **kwargs):
+        """
+        Send a message from the gateway itself
+        """
+        if isinstance(message, dict):
+            message = json.dumps(message)
+
+        await self._client.publish(
+            f"{self._topic}/gateway/{topic}",
+            str(message).encode(),
+            **kwargs,
+        )
+
+    @asynccontextmanager
+    async def cluster_messages(self):
+        """
+        Shorthand to get messages used to coordinate gateway instances
+
+        Subscribes once the filter is in place, so retained members and claims
+        are not missed.
+        """
+        topic = f"{self._topic}/cluster/#"
+        async with self._client.filtered_messages(topic) as messages:
+            await self._client.subscribe(topic)
+            yield messages
+
     def filtered_messages(self, device, topic="#"):
         """
         Shorthand to get messages for a specific device
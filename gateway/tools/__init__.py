@@ -1,3 +1,9 @@
-from .tasks import Tasks
+from .tasks import Tasks, wait_event
 from .config import Config
 from .state import State
+from .snapshot import Snapshot
+from .history import History
+from .poller import Poller
+from .monitor import LoopMonitor
+from .profiler import Profiler
+from .trace import tracer, FileExporter, OtlpExporter
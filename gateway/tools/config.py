@@ -1,5 +1,5 @@
-import yaml
 import logging
+import yaml
 
 
 class Config:
@@ -23,7 +23,7 @@ class Config:
             subsection = self._get(prefix, section, info)
             return self._get(remainder, subsection, info)
 
-        if path not in section:
+        if section is None or path not in section:
             if "raise" in info:
                 raise info["raise"]
             return info["fallback"]
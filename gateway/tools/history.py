@@ -0,0 +1,148 @@
+import math
+import time
+
+from array import array
+
+
+class History:
+    """
+    Fixed-size ring buffer of recent device samples
+
+    Samples are stored in typed arrays, one per field. The arrays are created with
+    the first sample and grow until the buffer is full, so the memory used per
+    device is bounded by BYTES_PER_SAMPLE * size. Unknown values are stored as
+    NaN (floats) or -1 (integers). A size of 0 disables the history.
+    """
+
+    __slots__ = ("_size", "_next", "_count", "_columns")
+
+    # field name -> array typecode
+    FIELDS = {
+        "time": "d",
+        "temperature": "f",
+        "mode": "b",
+        "valve": "b",
+        "available": "b",
+        "latency": "f",
+    }
+
+    BYTES_PER_SAMPLE = sum(array(code).itemsize for code in FIELDS.values())
+    DEFAULT_SIZE = 512
+
+    def __init__(self, size=DEFAULT_SIZE):
+        if not isinstance(size, int) or size < 0:
+            raise Exception(f"Invalid history size {size}")
+
+        self._size = size
+        self._next = 0
+        self._count = 0
+        self._columns = None
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        if self._columns is None:
+            return 0
+        return sum(c.itemsize * len(c) for c in self._columns.values())
+
+    def record(
+        self, temperature=None, mode=None, valve=None, available=None, latency=None
+    ):
+        """
+        Append a sample, overwriting the oldest one if the buffer is full
+        """
+
+        if not self._size:
+            return
+
+        sample = {
+            "time": time.time(),
+            "temperature": math.nan if temperature is None else temperature,
+            "mode": -1 if mode is None else int(mode),
+            "valve": -1 if valve is None else valve,
+            "available": -1 if available is None else int(available),
+            "latency": math.nan if latency is None else latency,
+        }
+
+        if self._columns is None:
+            self._columns = {
+                field: array(code) for field, code in History.FIELDS.items()
+            }
+
+        i = self._next
+        for field, value in sample.items():
+            column = self._columns[field]
+            if i < len(column):
+                column[i] = value
+            else:
+                column.append(value)
+
+        self._next = (i + 1) % self._size
+        self._count = min(self._count + 1, self._size)
+
+    def _indices(self, since):
+        if not self._count:
+            return
+
+        start = (self._next - self._count) % self._size
+        times = self._columns["time"]
+
+        for offset in range(self._count):
+            i = (start + offset) % self._size
+            if since is None or times[i] >= since:
+                yield i
+
+    @staticmethod
+    def _mean(values):
+        values = [v for v in values if not math.isnan(v)]
+        return round(sum(values) / len(values), 3) if values else None
+
+    @staticmethod
+    def _integers(values, reduce):
+        values = [v for v in values if v >= 0]
+        return reduce(values) if values else None
+
+    def query(self, since=None, points=None):
+        """
+        Get samples in chronological order as columns
+
+        If points is given, consecutive samples are merged into at most that many
+        buckets: setpoint, valve and latency are averaged, the mode of the last
+        sample is kept and the device counts as available only if it was
+        available for the whole bucket.
+        """
+
+        indices = list(self._indices(since))
+
+        if points is None or points <= 0 or points >= len(indices):
+            buckets = [[i] for i in indices]
+        else:
+            buckets = [
+                indices[len(indices) * b // points : len(indices) * (b + 1) // points]
+                for b in range(points)
+            ]
+
+        columns = self._columns
+        result = {field: [] for field in History.FIELDS}
+
+        for bucket in buckets:
+            result["time"].append(round(columns["time"][bucket[-1]], 3))
+            result["temperature"].append(
+                self._mean(columns["temperature"][i] for i in bucket)
+            )
+            mode = columns["mode"][bucket[-1]]
+            result["mode"].append(mode if mode >= 0 else None)
+            result["valve"].append(
+                self._mean(
+                    columns["valve"][i] if columns["valve"][i] >= 0 else math.nan
+                    for i in bucket
+                )
+            )
+            result["available"].append(
+                self._integers([columns["available"][i] for i in bucket], min)
+            )
+            result["latency"].append(self._mean(columns["latency"][i] for i in bucket))
+
+        return result
@@ -0,0 +1,91 @@
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+
+
+class LoopMonitor:
+    """
+    Detects callbacks that block the event loop
+
+    A task updates a heartbeat at a fixed interval. A watchdog thread checks the
+    heartbeat and, if the loop is stalled for longer than the threshold, records the
+    stack of the blocking code and the task it belongs to.
+    """
+
+    def __init__(self, interval=0.1, threshold=0.5, history=50):
+        self._interval = interval
+        self._threshold = threshold
+        self._events = collections.deque(maxlen=history)
+
+        self._loop = None
+        self._running = False
+        self._thread_id = None
+        self._beat = time.monotonic()
+        self._max_lag = 0.0
+
+    @property
+    def events(self):
+        """
+        Recently recorded stalls
+        """
+        return list(self._events)
+
+    @property
+    def max_lag(self):
+        return self._max_lag
+
+    def _capture(self, lag):
+        frame = sys._current_frames().get(self._thread_id)
+        task = asyncio.current_task(self._loop)
+
+        return {
+            "time": time.time(),
+            "lag": round(lag, 3),
+            "task": task.get_name() if task is not None else None,
+            "stack": traceback.format_stack(frame, limit=8) if frame else [],
+        }
+
+    def _watch(self):
+        reported = None
+
+        while self._running:
+            time.sleep(self._interval)
+
+            beat = self._beat
+            lag = time.monotonic() - beat
+            if lag < self._threshold or reported == beat:
+                continue
+
+            # report every stall once
+            reported = beat
+            event = self._capture(lag)
+            self._events.append(event)
+
+            logging.warning(
+                "Event loop blocked for %.3fs in %s:\n%s",
+                lag,
+                event["task"],
+                "".join(event["stack"]),
+            )
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._running = True
+
+        threading.Thread(target=self._watch, name="loop monitor", daemon=True).start()
+
+        try:
+            while True:
+                await asyncio.sleep(self._interval)
+
+                now = time.monotonic()
+                self._max_lag = max(self._max_lag, now - self._beat - self._interval)
+                self._beat = now
+        finally:
+            self._running = False
@@ -0,0 +1,80 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from .tasks import wait_event
+
+
+class Poller:
+    """
+    Polls all devices from a single task
+
+    Devices are kept in a heap ordered by the time of their next poll. Every poll
+    runs in a short-lived task, so a slow device does not delay the others. The
+    next poll of a device is scheduled once its current poll has finished.
+    """
+
+    def __init__(self):
+        # (due, sequence, device)
+        self._queue = []
+        self._sequence = itertools.count()
+        self._devices = set()
+        self._active = {}
+        self._changed = asyncio.Event()
+
+    def _schedule(self, device):
+        due = time.monotonic() + device.poll_interval
+        heapq.heappush(self._queue, (due, next(self._sequence), device))
+        self._changed.set()
+
+    def add(self, device):
+        if device.poll_interval is None:
+            logging.info(f"{device} not polling")
+            return
+
+        logging.info(f"{device} polling every {device.poll_interval}s")
+        self._devices.add(device)
+        self._schedule(device)
+
+    async def remove(self, device):
+        # entries of removed devices are dropped once they are due
+        self._devices.discard(device)
+
+        task = self._active.pop(device, None)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def _done(self, device, task):
+        if self._active.get(device) is task:
+            del self._active[device]
+
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Polling {device} failed", exc_info=task.exception())
+
+        if device in self._devices:
+            self._schedule(device)
+
+    async def run(self):
+        try:
+            while True:
+                self._changed.clear()
+
+                now = time.monotonic()
+                while self._queue and self._queue[0][0] <= now:
+                    _, _, device = heapq.heappop(self._queue)
+                    if device not in self._devices:
+                        continue
+
+                    task = asyncio.create_task(device.poll(), name=f"polling {device}")
+                    task.add_done_callback(lambda task, d=device: self._done(d, task))
+                    self._active[device] = task
+
+                timeout = self._queue[0][0] - now if self._queue else None
+                await wait_event(self._changed, timeout)
+
+        finally:
+            for task in self._active.values():
+                task.cancel()
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import logging
+import time
+
+from asyncio import events
+
+
+class Profiler:
+    """
+    Profiles the running event loop for a limited time
+
+    Every callback executed by the loop is timed. Task steps are attributed to the
+    task they belong to, so the result lists CPU and wall time per coroutine.
+    """
+
+    def __init__(self):
+        self._stats = None
+
+    @property
+    def running(self):
+        return self._stats is not None
+
+    @staticmethod
+    def _key(callback):
+        task = getattr(callback, "__self__", None)
+        if isinstance(task, asyncio.Task):
+            return f"{task.get_name()} ({task.get_coro().__qualname__})"
+
+        return getattr(callback, "__qualname__", type(callback).__name__)
+
+    def _instrument(self):
+        run = events.Handle._run
+        stats = self._stats
+        key = self._key
+
+        def _run(handle):
+            wall = time.perf_counter()
+            cpu = time.thread_time()
+            try:
+                return run(handle)
+            finally:
+                wall = time.perf_counter() - wall
+                cpu = time.thread_time() - cpu
+
+                entry = stats.setdefault(key(handle._callback), [0, 0.0, 0.0, 0.0])
+                entry[0] += 1
+                entry[1] += cpu
+                entry[2] += wall
+                entry[3] = max(entry[3], wall)
+
+        events.Handle._run = _run
+        return run
+
+    async def profile(self, duration, filename):
+        """
+        Profile the event loop and write per coroutine statistics to a file
+        """
+
+        if self.running:
+            raise Exception("Profiler already running")
+
+        logging.info(f"Profiling for {duration}s...")
+
+        self._stats = {}
+        run = self._instrument()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            events.Handle._run = run
+            stats, self._stats = self._stats, None
+
+        result = {
+            "duration": duration,
+            "coroutines": [
+                {
+                    "name": name,
+                    "steps": steps,
+                    "cpu": round(cpu, 6),
+                    "wall": round(wall, 6),
+                    "max": round(slowest, 6),
+                }
+                for name, (steps, cpu, wall, slowest) in sorted(
+                    stats.items(), key=lambda item: item[1][1], reverse=True
+                )
+            ],
+        }
+
+        with open(filename, "w") as profile_file:
+            json.dump(result, profile_file, indent=2)
+
+        logging.info(f"Profile written to {filename}")
+        return result
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+
+
+class Snapshot:
+    """
+    Persists device state across restarts
+
+    Device data is kept in memory and written to a compact JSON file shortly after
+    it changes, so bursts of changes result in a single write. The file is written
+    once more on shutdown.
+    """
+
+    def __init__(self, filename, delay=2.0):
+        self._filename = filename
+        self._delay = delay
+        self._data = {}
+        self._pending = None
+
+        # writes happen on the loop and in the executor, newer dumps win
+        self._lock = threading.Lock()
+        self._version = 0
+        self._written = 0
+
+        try:
+            with open(self._filename, "r") as snapshot_file:
+                self._data = json.load(snapshot_file)
+
+            logging.info(f"Restored snapshot of {len(self._data)} devices")
+        except FileNotFoundError:
+            pass
+        except:
+            logging.exception(f"Failed to restore snapshot {self._filename}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def _write(self, version, payload):
+        with self._lock:
+            # a newer snapshot was written in the meantime
+            if version <= self._written:
+                return
+
+            temporary = f"{self._filename}.tmp"
+            with open(temporary, "w") as snapshot_file:
+                snapshot_file.write(payload)
+
+            # replace atomically so a crash never leaves a partial snapshot
+            os.replace(temporary, self._filename)
+            self._written = version
+
+    def _dump(self):
+        self._version += 1
+        return self._version, json.dumps(self._data, separators=(",", ":"))
+
+    def _checkpoint(self):
+        self._pending = None
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, self._write, *self._dump())
+        future.add_done_callback(self._checkpointed)
+
+    def _checkpointed(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            logging.error(
+                f"Failed to write snapshot {self._filename}",
+                exc_info=future.exception(),
+            )
+
+    def get(self, id):
+        return self._data.get(id)
+
+    def update(self, id, data):
+        """
+        Store device data and schedule a checkpoint if it changed
+        """
+
+        if self._data.get(id) == data:
+            return
+
+        self._data[id] = data
+        if self._pending is None:
+            loop = asyncio.get_running_loop()
+            self._pending = loop.call_later(self._delay, self._checkpoint)
+
+    def remove(self, id):
+        if self._data.pop(id, None) is not None:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the snapshot immediately
+        """
+
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+
+        try:
+            self._write(*self._dump())
+        except:
+            logging.exception(f"Failed to write snapshot {self._filename}")
@@ -9,6 +9,8 @@ class State:
     do not provide a stable connection.
     """
 
+    __slots__ = ("_prefer_remote", "_local", "_remote")
+
     def __init__(self, prefer_remote=False):
         self._prefer_remote = prefer_remote
 
@@ -43,7 +45,7 @@ class State:
             if local == remote:
                 self._remote[key] = remote
 
-        logging.debug(f"State merged {changes}\n{self}")
+        logging.debug("State merged %s\n%s", changes, self)
 
     def push_local(self, local):
         """
@@ -55,7 +57,7 @@ class State:
             if self._local.get(key) != value:
                 self._local[key] = value
 
-        logging.debug(f"State pushed {local}\n{self}")
+        logging.debug("State pushed %s\n%s", local, self)
 
     def get_patch(self):
         """
@@ -69,7 +71,7 @@ class State:
             if local != self._remote.get(key):
                 patch[key] = local
 
-        logging.debug(f"State patching {patch}\n{self}")
+        logging.debug("State patching %s\n%s", patch, self)
 
         return patch
 
@@ -78,3 +80,23 @@ class State:
 
     def local(self, key):
         return self._local.get(key)
+
+    def dump(self):
+        """
+        Get a serializable copy of the state
+        """
+        return {"local": dict(self._local), "remote": dict(self._remote)}
+
+    def restore(self, data, types={}):
+        """
+        Restore a state previously returned by dump
+        """
+
+        def convert(values):
+            return {
+                key: types[key](value) if key in types else value
+                for key, value in values.items()
+            }
+
+        self._local = convert(data.get("local", {}))
+        self._remote = convert(data.get("remote", {}))
@@ -9,6 +9,7 @@ class Tasks:
 
     def __init__(self):
         self._tasks = set()
+        self._spawned = asyncio.Event()
 
     async def __aenter__(self):
         return self
@@ -50,10 +51,65 @@ class Tasks:
             logging.debug(f"{name} completed")
 
     def spawn(self, task, name=None):
-        self._tasks.add(asyncio.create_task(self._runner(task, name)))
+        coroutine = task
+        task = asyncio.create_task(self._runner(coroutine, name), name=name)
+
+        # tasks cancelled before they started never await their coroutine
+        if asyncio.iscoroutine(coroutine):
+            task.add_done_callback(lambda _: coroutine.close())
+
+        self._tasks.add(task)
+        self._spawned.set()
+
+        return task
+
+    async def cancel(self, *tasks):
+        """
+        Cancel specific tasks and wait until they are finished
+        """
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.difference_update(tasks)
 
     async def gather(self):
         logging.info(f"Awaiting {len(self._tasks)} tasks")
 
         # wait until all tasks are completed or an exception is caught
-        await asyncio.gather(*self._tasks)
+        # tasks spawned in the meantime are included as well
+        while self._tasks:
+            self._spawned.clear()
+            spawned = asyncio.create_task(self._spawned.wait())
+
+            try:
+                done, _ = await asyncio.wait(
+                    self._tasks | {spawned}, return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                spawned.cancel()
+
+            for task in done - {spawned}:
+                self._tasks.discard(task)
+
+                # tasks cancelled before they started never reach the runner
+                if not task.cancelled():
+                    task.result()
+
+
+async def wait_event(event, timeout=None):
+    """
+    Wait until the event is set or the timeout expired, returns whether it is set
+
+    asyncio.wait_for (python 3.11 and below) drops a cancellation that arrives
+    while the event is set, so loops waiting this way could not be stopped.
+    """
+
+    waiter = asyncio.create_task(event.wait())
+    try:
+        await asyncio.wait([waiter], timeout=timeout)
+    finally:
+        waiter.cancel()
+
+    return event.is_set()
@@ -0,0 +1,263 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+
+
+# span of the currently running operation
+_current = contextvars.ContextVar("span", default=None)
+
+
+class _NoopSpan:
+    """
+    Shared span used while tracing is disabled
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, key, value):
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+class Span:
+    """
+    Timed operation within a trace
+    """
+
+    __slots__ = (
+        "_tracer",
+        "_token",
+        "_spans",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "attributes",
+        "start",
+        "duration",
+        "error",
+    )
+
+    def __init__(self, tracer, name, parent, attributes):
+        self._tracer = tracer
+        self._token = None
+
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attributes = attributes
+        self.start = 0.0
+        self.duration = 0.0
+        self.error = None
+
+        # spans of the trace are collected by the root span
+        self._spans = parent._spans if parent else []
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self.start = time.time()
+        self.duration = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.duration
+        _current.reset(self._token)
+
+        if exc_type is not None and exc_type is not asyncio.CancelledError:
+            self.error = f"{exc_type.__name__}: {exc}"
+
+        self._spans.append(self)
+        if self.parent_id is None:
+            self._tracer._export(self._spans)
+
+        return False
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def dump(self):
+        return {
+            "trace": self.trace_id,
+            "span": self.span_id,
+            "parent": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": round(self.duration, 6),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Tracer:
+    """
+    Lightweight tracing of commands from MQTT to the BLE device
+
+    Root spans start a new trace, nested spans are attached to the trace of the
+    current context. Completed traces are handed to the configured exporter. If
+    tracing is disabled, a shared no-op span is returned.
+    """
+
+    def __init__(self):
+        self._exporter = None
+
+    @property
+    def enabled(self):
+        return self._exporter is not None
+
+    def configure(self, exporter):
+        self._exporter = exporter
+
+    def trace(self, name, **attributes):
+        """
+        Start a new trace unless already part of one
+        """
+        if self._exporter is None:
+            return NOOP
+
+        return Span(self, name, _current.get(), attributes)
+
+    def span(self, name, **attributes):
+        """
+        Start a span within the current trace
+        """
+        if self._exporter is None:
+            return NOOP
+
+        parent = _current.get()
+        if parent is None:
+            return NOOP
+
+        return Span(self, name, parent, attributes)
+
+    def _export(self, spans):
+        try:
+            self._exporter.export(spans)
+        except:
+            logging.exception("Failed to export trace")
+
+
+class FileExporter:
+    """
+    Writes completed traces as JSON lines to a rotating file
+    """
+
+    def __init__(self, filename, max_bytes=1048576, backups=3):
+        import logging.handlers
+
+        self._logger = logging.getLogger("gateway.traces")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._logger.addHandler(
+            logging.handlers.RotatingFileHandler(
+                filename, maxBytes=max_bytes, backupCount=backups
+            )
+        )
+
+    def export(self, spans):
+        self._logger.info(
+            json.dumps([span.dump() for span in spans], separators=(",", ":"))
+        )
+
+
+class OtlpExporter:
+    """
+    Sends completed traces in batches to an OTLP/HTTP (JSON) collector
+    """
+
+    def __init__(self, endpoint, service="eq3bt-gateway", delay=5.0):
+        self._url = f"{endpoint.rstrip('/')}/v1/traces"
+        self._service = service
+        self._delay = delay
+        self._spans = []
+        self._pending = None
+
+    @staticmethod
+    def _attribute(key, value):
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def _span(self, span):
+        start = int(span.start * 1e9)
+        message = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + int(span.duration * 1e9)),
+            "attributes": [
+                self._attribute(key, value) for key, value in span.attributes.items()
+            ],
+            "status": {"code": 2, "message": span.error} if span.error else {},
+        }
+        if span.parent_id:
+            message["parentSpanId"] = span.parent_id
+
+        return message
+
+    def _send(self, payload):
+        import urllib.request
+
+        request = urllib.request.Request(
+            self._url,
+            data=payload,
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=10):
+            pass
+
+    def _flush(self):
+        self._pending = None
+        spans, self._spans = self._spans, []
+
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [self._attribute("service.name", self._service)]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": self._service},
+                            "spans": [self._span(span) for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+        future = asyncio.get_running_loop().run_in_executor(
+            None, self._send, json.dumps(payload).encode()
+        )
+        future.add_done_callback(self._sent)
+
+    @staticmethod
+    def _sent(future):
+        if future.exception() is not None:
+            logging.warning(f"Failed to send traces: {future.exception()}")
+
+    def export(self, spans):
+        self._spans.extend(spans)
+
+        if self._pending is None:
+            loop = asyncio.get_running_loop()
+            self._pending = loop.call_later(self._delay, self._flush)
+
+
+# shared tracer of the gateway
+tracer = Tracer()
@@ -0,0 +1 @@
+from .zone import Zone
@@ -0,0 +1,110 @@
+import logging
+import asyncio
+import time
+
+from mqtt import HassMqttDevice
+from tools import tracer
+
+
+class Zone(HassMqttDevice):
+    """
+    Group of devices that are controlled together
+
+    Commands sent to a zone are expanded into a single planned batch. Devices are
+    ordered to minimize radio time and progress is reported on the status topic.
+
+    In a cluster, every instance runs the zone for the members it drives and
+    reports them on its own status topic (status/<instance>).
+    """
+
+    def __init__(self, *args, instance=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._members = self._config.require("devices")
+        self._instance = instance
+
+    def __str__(self):
+        return f"zone {self._id}"
+
+    @property
+    def component(self):
+        return "zone"
+
+    async def _mqtt_temperature_set(self, temperature):
+        await self.execute("temperature_set", temperature, self._publish_status)
+
+    async def _mqtt_mode_set(self, mode):
+        await self.execute("mode_set", mode, self._publish_status)
+
+    def _plan(self):
+        """
+        Resolve zone members and order them by signal strength
+        """
+
+        devices = []
+        for id in self._members:
+            device = self._mqtt.device(id)
+            if device is None:
+                # members of a cluster may be driven by another instance
+                if self._instance is None:
+                    logging.warning(f"{self} has unknown device {id}")
+                continue
+            devices.append(device)
+
+        connections = {d.connection: d for d in devices if d.connection}
+        planned = [connections[c] for c in self._ble.plan(list(connections))]
+
+        # devices without BLE connection are handled last
+        return planned + [d for d in devices if d.connection is None]
+
+    async def execute(self, command, payload, progress=None):
+        """
+        Run a command on all zone members as a single planned batch
+        """
+
+        start = time.monotonic()
+
+        # discover all missing devices with a single scan
+        devices = self._plan()
+        if any(d.connection and not d.connection.discovered for d in devices):
+            await self._ble.discover()
+            devices = self._plan()
+
+        status = {
+            "command": command,
+            "payload": payload,
+            "total": len(devices),
+            "done": 0,
+            "results": {device.id: "pending" for device in devices},
+            "elapsed": 0.0,
+        }
+        if progress is not None:
+            await progress(status)
+
+        for device in devices:
+            try:
+                with tracer.span("zone.device", device=device.id):
+                    success = await device.command(command, payload)
+                status["results"][device.id] = "failed" if success is False else "ok"
+            except asyncio.CancelledError:
+                # ensure cancellation is not swallowed
+                raise
+            except:
+                logging.exception(f"{self} failed to handle {command} on {device}")
+                status["results"][device.id] = "error"
+
+            status["done"] += 1
+            status["elapsed"] = round(time.monotonic() - start, 3)
+            if progress is not None:
+                await progress(status)
+
+        return status
+
+    async def _publish_status(self, status):
+        if self._instance is None:
+            await self._mqtt.publish(self, "status", status)
+
+        # instances without members of the zone stay silent
+        elif status["total"]:
+            status = dict(status, instance=self._instance)
+            await self._mqtt.publish(self, f"status/{self._instance}", status)
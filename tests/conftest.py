@@ -0,0 +1,8 @@
+import os
+import sys
+
+
+# make the gateway modules and the in-memory broker importable
+root = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(root, "gateway"))
+sys.path.insert(0, os.path.join(root, "benchmarks"))
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import socket
+import stat
+
+from eq3bt.eq3btsmart import PROP_TEMPERATURE_WRITE
+
+from api import LocalApi
+from devices.eq3smart import Device
+from tools import Config
+
+import simulation
+
+from simulation import SimulatedBleManager
+
+
+class Messenger(simulation.Messenger):
+    """
+    Messenger that knows the registered devices
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.devices = {}
+
+    def device(self, id):
+        return self.devices.get(id)
+
+
+async def connect(api):
+    """
+    Serve a client of the API over a stream pair
+    """
+
+    server, client = socket.socketpair()
+
+    reader, writer = await asyncio.open_connection(sock=server)
+    task = asyncio.create_task(api._client(reader, writer))
+
+    reader, writer = await asyncio.open_connection(sock=client)
+    return task, reader, writer
+
+
+async def request(reader, writer, **message):
+    writer.write(json.dumps(message).encode() + b"\n")
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+def test_requests_are_served():
+    async def run():
+        ble = SimulatedBleManager()
+        messenger = Messenger()
+        for i in range(3):
+            config = Config(config={"mac": f"AA:{i:02X}", "schedule": False})
+            device = Device(f"d{i}", config, messenger, ble)
+            messenger.devices[device.id] = device
+            ble.register(device.connection)
+            await device._pull()
+
+        api = LocalApi(Config(config={}), messenger, ble)
+        task, reader, writer = await connect(api)
+
+        response = await request(reader, writer, op="get", device="d0")
+        assert response["ok"]
+        assert response["state"]["temperature"] == 21.0
+        assert response["state"]["mode"] == "heat"
+
+        response = await request(reader, writer, op="get")
+        assert set(response["states"]) == {"d0", "d1", "d2"}
+
+        response = await request(
+            reader, writer, op="set_temperature", device="d0", value=19.5
+        )
+        assert response["ok"] and response["success"]
+        assert response["state"]["temperature"] == 19.5
+        assert ble.thermostat("AA:00").writes[-1] == bytes([PROP_TEMPERATURE_WRITE, 39])
+
+        response = await request(
+            reader, writer, op="set_mode", device="d1", value="off"
+        )
+        assert response["ok"] and response["success"]
+        assert response["state"]["mode"] == "off"
+
+        response = await request(
+            reader,
+            writer,
+            op="bulk",
+            devices=["d0", "d2"],
+            command="set_mode",
+            value="auto",
+        )
+        assert response["ok"]
+        assert response["results"] == {"d0": "ok", "d2": "ok"}
+        assert {id: state["mode"] for id, state in response["states"].items()} == {
+            "d0": "auto",
+            "d2": "auto",
+        }
+
+        response = await request(reader, writer, op="history", device="d0")
+        assert response["ok"]
+        assert response["history"]["temperature"][0] == 21.0
+
+        # errors are reported without closing the connection
+        response = await request(reader, writer, op="get", device="unknown")
+        assert not response["ok"]
+        assert "unknown" in response["error"]
+
+        response = await request(reader, writer, op="reboot")
+        assert not response["ok"]
+
+        writer.close()
+        await task
+
+    asyncio.run(run())
+
+
+def test_unix_socket_is_private_and_removed(tmp_path):
+    async def run():
+        path = str(tmp_path / "api.sock")
+
+        # stale socket of a previous run
+        with open(path, "w"):
+            pass
+
+        api = LocalApi(Config(config={"socket": path}), Messenger(), None)
+        task = asyncio.create_task(api.run())
+
+        while not stat.S_ISSOCK(os.stat(path).st_mode):
+            await asyncio.sleep(0.01)
+
+        reader, writer = await asyncio.open_unix_connection(path)
+        response = await request(reader, writer, op="get")
+        assert response["ok"] and response["states"] == {}
+        writer.close()
+
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert not os.path.exists(path)
+
+    asyncio.run(run())
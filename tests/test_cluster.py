@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import functools
+import json
+import os
+import sys
+
+import pytest
+
+import main
+import mqtt.messenger
+
+from broker import MemoryBroker, MemoryClient, TcpBroker, TcpClient
+from main import Gateway
+from mqtt import HassMqttMessenger
+from tools import Config, Tasks
+
+from simulation import SimulatedBleManager
+
+
+DEVICES = {
+    f"d{i}": {"module": "eq3smart", "mac": f"AA:{i:02X}", "schedule": False}
+    for i in range(4)
+}
+
+HEARTBEAT = 0.2
+SETTLE = 0.2
+
+
+def configure(filename, name, broker="memory"):
+    with open(filename, "w") as config_file:
+        json.dump(
+            {
+                "mqtt": {"broker": broker},
+                "cluster": {
+                    "instance": name,
+                    "heartbeat": HEARTBEAT,
+                    "settle": SETTLE,
+                },
+                "devices": DEVICES,
+                "snapshot": "",
+                "reload": 0,
+                "monitor": {"threshold": 0},
+            },
+            config_file,
+        )
+
+
+class Instance:
+    def __init__(self, name, directory, signal):
+        self.name = name
+        self.filename = str(directory / f"{name}.json")
+        configure(self.filename, name)
+
+        config = Config(self.filename)
+        self.mqtt = HassMqttMessenger(config)
+        self.ble = SimulatedBleManager(
+            {DEVICES[id]["mac"]: rssi for id, rssi in signal.items()}
+        )
+        self.tasks = Tasks()
+        self.gateway = None
+
+    async def start(self):
+        await self.mqtt.__aenter__()
+        self.gateway = Gateway(self.filename, self.tasks, self.mqtt, self.ble)
+        await self.gateway.start()
+
+    async def stop(self):
+        await self.tasks.__aexit__(None, None, None)
+        await self.mqtt.__aexit__(None, None, None)
+
+    async def kill(self):
+        # connection drops without a graceful exit
+        self.mqtt.client.kill()
+        self.tasks._invoke_shutdown()
+        await asyncio.gather(*self.tasks._tasks, return_exceptions=True)
+
+    @property
+    def running(self):
+        return set(self.gateway.running)
+
+
+async def settle(instances, expected, timeout=10):
+    """
+    Wait for the expected assignment while checking that no device is driven twice
+    """
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    while True:
+        running = [instance.running for instance in instances]
+        for i, first in enumerate(running):
+            for second in running[i + 1 :]:
+                assert not first & second, "device driven by two instances"
+
+        if all(instance.running == expected[instance.name] for instance in instances):
+            return
+        if loop.time() > deadline:
+            pytest.fail(f"assignment not reached: {running}")
+
+        await asyncio.sleep(0.01)
+
+
+def test_devices_are_shared_and_handed_over(tmp_path):
+    async def run():
+        MemoryClient.broker = MemoryBroker()
+        mqtt.messenger.Client = MemoryClient
+
+        # each host is close to two of the thermostats
+        a = Instance("a", tmp_path, {"d0": -40, "d1": -45, "d2": -90, "d3": -90})
+        b = Instance("b", tmp_path, {"d0": -90, "d1": -90, "d2": -40, "d3": -45})
+
+        await a.start()
+        await settle([a], {"a": set(DEVICES)})
+
+        # second instance takes over the devices it reaches best
+        await b.start()
+        await settle([a, b], {"a": {"d0", "d1"}, "b": {"d2", "d3"}})
+
+        # will of the crashed instance hands its devices back
+        await b.kill()
+        await settle([a], {"a": set(DEVICES)})
+
+        await a.stop()
+
+    asyncio.run(run())
+
+
+def test_concurrent_claims_do_not_start_devices_twice(tmp_path):
+    async def run():
+        MemoryClient.broker = MemoryBroker()
+        mqtt.messenger.Client = MemoryClient
+
+        # both instances start at once and claim before they see each other
+        a = Instance("a", tmp_path, {"d0": -40, "d1": -45, "d2": -90, "d3": -90})
+        b = Instance("b", tmp_path, {"d0": -90, "d1": -90, "d2": -40, "d3": -45})
+
+        await asyncio.gather(a.start(), b.start())
+        await settle([a, b], {"a": {"d0", "d1"}, "b": {"d2", "d3"}})
+
+        await asyncio.gather(a.stop(), b.stop())
+
+    asyncio.run(run())
+
+
+def process(filename, signal):
+    """
+    Run a gateway instance in a process of its own (see spawn)
+    """
+
+    signal = json.loads(signal)
+    mqtt.messenger.Client = TcpClient
+    main.BleManager = functools.partial(
+        SimulatedBleManager, {DEVICES[id]["mac"]: rssi for id, rssi in signal.items()}
+    )
+
+    args = argparse.Namespace(
+        config=filename,
+        profile=None,
+        profile_output=os.devnull,
+        record=None,
+        replay=None,
+        replay_speed=1.0,
+    )
+    asyncio.run(main.run(args))
+
+
+async def spawn(directory, name, port, signal):
+    filename = str(directory / f"{name}.json")
+    configure(filename, name, broker=f"127.0.0.1:{port}")
+
+    return await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-c",
+        "import sys, conftest, test_cluster; test_cluster.process(*sys.argv[1:])",
+        filename,
+        json.dumps(signal),
+        cwd=os.path.dirname(__file__),
+    )
+
+
+async def until(condition, timeout=20):
+    """
+    Wait until the condition holds for the state published by the processes
+    """
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    while not condition():
+        if loop.time() > deadline:
+            pytest.fail("condition not reached in time")
+        await asyncio.sleep(0.05)
+
+
+def test_instances_in_separate_processes(tmp_path):
+    async def run():
+        broker = TcpBroker()
+        port = await broker.start()
+
+        retained = broker.broker.retained
+        observed = {}
+        observer = TcpClient(f"127.0.0.1:{port}")
+        topic = "eq3bt/cluster/claims/#"
+
+        async def observe(messages):
+            async for message in messages:
+                id = message.topic.split("/")[-1]
+                observed[id] = message.payload.decode()
+
+        processes = []
+        try:
+            async with observer, observer.filtered_messages(topic) as messages:
+                await observer.subscribe(topic)
+                listener = asyncio.create_task(observe(messages))
+
+                # each host is close to two of the thermostats
+                processes.append(
+                    await spawn(tmp_path, "a", port, {"d0": -40, "d1": -45})
+                )
+                processes.append(
+                    await spawn(tmp_path, "b", port, {"d2": -40, "d3": -45})
+                )
+                await until(
+                    lambda: observed == {"d0": "a", "d1": "a", "d2": "b", "d3": "b"}
+                )
+
+                # devices are driven and published by their instances
+                await until(
+                    lambda: all(
+                        f"homeassistant/climate/eq3bt/{id}/state" in retained
+                        for id in DEVICES
+                    )
+                )
+
+                # the broker publishes the will of the crashed instance
+                processes[1].kill()
+                await until(lambda: observed == {id: "a" for id in DEVICES})
+
+                listener.cancel()
+
+        finally:
+            for child in processes:
+                if child.returncode is None:
+                    child.kill()
+                await child.wait()
+            await broker.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from ble import BleConnection
+
+from simulation import SimulatedBleManager
+
+
+async def use(connection, hold=0.05):
+    async with connection:
+        await asyncio.sleep(hold)
+
+
+def test_overlapping_use_of_one_device():
+    async def run():
+        manager = SimulatedBleManager(delay=0.01)
+        first = BleConnection("AA", manager)
+        second = BleConnection("BB", manager)
+
+        # second device holds the radio while the first one is used twice
+        busy = asyncio.create_task(use(second))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(asyncio.gather(use(first), use(first), busy), timeout=5)
+
+        assert not manager.semaphore.locked()
+        assert not first.connected
+
+        # radio is still usable afterwards
+        await asyncio.wait_for(use(second), timeout=1)
+
+    asyncio.run(run())
+
+
+def test_failed_connect_releases_device():
+    async def run():
+        manager = SimulatedBleManager(delay=0.01)
+        connection = BleConnection("AA", manager)
+
+        # device is never discovered
+        manager._unsafe_discover = lambda timeout=15.0: asyncio.sleep(0)
+
+        for _ in range(2):
+            with pytest.raises(Exception, match="not available"):
+                await asyncio.wait_for(use(connection), timeout=1)
+
+        assert not manager.semaphore.locked()
+
+    asyncio.run(run())
+
+
+def test_cancelled_wait_for_semaphore_releases_radio():
+    async def run():
+        manager = SimulatedBleManager(delay=0.01)
+        first = BleConnection("AA", manager)
+        second = BleConnection("BB", manager)
+
+        # first device is cancelled while the second one holds the radio
+        busy = asyncio.create_task(use(second))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(use(first))
+        await asyncio.sleep(0.02)
+        waiting.cancel()
+        await asyncio.gather(busy, waiting, return_exceptions=True)
+
+        assert not manager.semaphore.locked()
+        await asyncio.wait_for(use(first), timeout=1)
+
+    asyncio.run(run())
@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+from contextlib import asynccontextmanager
+
+import mqtt.messenger
+
+from broker import MemoryBroker, MemoryClient
+from main import Gateway
+from mqtt import HassMqttMessenger
+from tools import Config, Tasks
+
+from simulation import SimulatedBleManager
+
+
+class Message:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class Messenger:
+    def __init__(self, messages):
+        self._messages = messages
+        self.published = []
+
+    @asynccontextmanager
+    async def gateway_messages(self):
+        async def messages():
+            for message in self._messages:
+                yield message
+
+        yield messages()
+
+    async def publish_gateway(self, topic, message, **kwargs):
+        self.published.append((topic, message))
+
+
+def test_invalid_gateway_commands_are_ignored(tmp_path):
+    async def run():
+        messenger = Messenger(
+            [
+                Message("eq3bt/gateway/profile", b"abc"),
+                # output directory does not exist
+                Message("eq3bt/gateway/profile", b"0.01"),
+            ]
+        )
+
+        async with Tasks() as tasks:
+            gateway = Gateway(None, tasks, messenger, None)
+            tasks.spawn(
+                gateway.listen(str(tmp_path / "missing" / "profile.json")), "listen"
+            )
+            await asyncio.wait_for(tasks.gather(), timeout=5)
+
+        assert messenger.published == []
+
+    asyncio.run(run())
+
+
+def test_removed_devices_are_cleared_from_home_assistant(tmp_path):
+    async def run():
+        MemoryClient.broker = MemoryBroker()
+        mqtt.messenger.Client = MemoryClient
+
+        filename = tmp_path / "config.json"
+        devices = {
+            id: {"module": "eq3smart", "mac": mac, "schedule": False}
+            for id, mac in [("kept", "AA:01"), ("removed", "AA:02")]
+        }
+        filename.write_text(json.dumps({"mqtt": {}, "devices": devices}))
+
+        messenger = HassMqttMessenger(Config(config={"mqtt": {"broker": "memory"}}))
+        ble = SimulatedBleManager({"AA:01": -50, "AA:02": -50})
+        retained = MemoryClient.broker.retained
+
+        async with messenger:
+            async with Tasks() as tasks:
+                gateway = Gateway(str(filename), tasks, messenger, ble)
+                await gateway.start()
+
+                base = "homeassistant/climate/eq3bt/removed"
+                while f"{base}/state" not in retained:
+                    await asyncio.sleep(0.01)
+
+                del devices["removed"]
+                filename.write_text(json.dumps({"mqtt": {}, "devices": devices}))
+                await gateway.reload()
+
+                assert f"{base}/config" not in retained
+                assert f"{base}/state" not in retained
+                assert "homeassistant/climate/eq3bt/kept/config" in retained
+
+                for id in list(gateway.running):
+                    await gateway.stop_device(id)
+                tasks._invoke_shutdown()
+
+    asyncio.run(run())
@@ -0,0 +1,39 @@
+import pytest
+
+from tools import History
+
+
+def test_ring_buffer_keeps_latest_samples():
+    history = History(4)
+    for i in range(6):
+        history.record(temperature=20 + i, mode=3, valve=i, available=True)
+
+    samples = history.query()
+    assert len(history) == 4
+    assert samples["temperature"] == [22, 23, 24, 25]
+    assert samples["latency"] == [None] * 4
+    assert history.nbytes == 4 * History.BYTES_PER_SAMPLE
+
+
+def test_downsampling_merges_buckets():
+    history = History(8)
+    for i in range(8):
+        history.record(temperature=20, valve=i, available=i != 3, latency=10.0)
+
+    samples = history.query(points=2)
+    assert samples["valve"] == [1.5, 5.5]
+    assert samples["available"] == [0, 1]
+
+
+def test_zero_size_disables_history():
+    history = History(0)
+    history.record(temperature=21)
+
+    assert len(history) == 0
+    assert history.nbytes == 0
+    assert history.query()["temperature"] == []
+
+
+def test_negative_size_is_rejected():
+    with pytest.raises(Exception, match="Invalid history size"):
+        History(-1)
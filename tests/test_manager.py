@@ -0,0 +1,35 @@
+import asyncio
+
+from ble import BleManager, BleConnection
+
+from simulation import Advertisement, Handle
+
+
+def scan(manager, measure, *addresses):
+    manager._detected = set()
+    manager._measured = set() if measure else None
+    manager._event.clear()
+    manager._check()
+
+    for address in addresses:
+        manager._scanner_callback(Handle(address), Advertisement(-60))
+
+    return manager._event.is_set()
+
+
+def test_scan_does_not_wait_for_watched_devices_out_of_range():
+    async def run():
+        manager = BleManager()
+        BleConnection("AA", manager)
+        manager.watch("AA")
+        manager.watch("BB")
+
+        # device of another instance is not in range
+        assert scan(manager, False, "AA")
+        assert not scan(manager, True, "AA")
+        assert scan(manager, True, "AA", "BB")
+
+        # nothing registered locally
+        assert scan(BleManager(), False)
+
+    asyncio.run(run())
@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from ble import Recorder, ReplayBleManager
+from devices.eq3smart import Device
+from tools import Config
+
+from simulation import Messenger, SimulatedBleManager
+
+
+async def pull(ble, schedule=True):
+    messenger = Messenger()
+    config = Config(config={"mac": "AA", "schedule": schedule})
+    device = Device("d", config, messenger, ble)
+
+    start = time.monotonic()
+    await device._pull()
+    return messenger.published, time.monotonic() - start
+
+
+def test_replay_publishes_recorded_state(tmp_path):
+    async def run():
+        capture = str(tmp_path / "capture.jsonl")
+
+        with Recorder(capture) as recorder:
+            recorded, _ = await pull(SimulatedBleManager(recorder=recorder))
+        replayed, _ = await pull(ReplayBleManager(capture, speed=0))
+
+        assert "schedule_state" in recorded
+        assert replayed == recorded
+
+    asyncio.run(run())
+
+
+def test_replay_keeps_recorded_timing(tmp_path):
+    async def run():
+        capture = str(tmp_path / "capture.jsonl")
+
+        with Recorder(capture) as recorder:
+            ble = SimulatedBleManager(recorder=recorder, delay=0.1)
+            _, recorded = await pull(ble, schedule=False)
+        _, replayed = await pull(ReplayBleManager(capture), schedule=False)
+
+        # connect and write take 0.1s each, the response is part of the write
+        assert recorded >= 0.2
+        assert replayed < recorded + 0.05
+
+    asyncio.run(run())
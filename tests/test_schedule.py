@@ -0,0 +1,94 @@
+import asyncio
+
+from eq3bt.structures import NAME_TO_DAY
+
+from devices import eq3smart
+from devices.eq3smart import Device
+from tools import Config
+
+from simulation import PERIODS, STATUS, Messenger, SimulatedBleManager, Thermostat
+
+
+class CountingDevice(Device):
+    """
+    Thermostat that never answers schedule queries
+    """
+
+    queries = 0
+
+    async def _schedule_query(self, days):
+        self.queries += 1
+        return await super()._schedule_query(days)
+
+
+class ChattyThermostat(Thermostat):
+    """
+    Thermostat that sends a status before answering each request
+    """
+
+    async def write_gatt_char(self, characteristic, data, *args, **kwargs):
+        await self._callback(characteristic, bytearray(STATUS))
+        await super().write_gatt_char(characteristic, data, *args, **kwargs)
+
+
+class ChattyBleManager(SimulatedBleManager):
+    def thermostat(self, address):
+        if address not in self.thermostats:
+            self.thermostats[address] = ChattyThermostat()
+        return self.thermostats[address]
+
+
+def test_unanswered_schedule_queries_back_off(monkeypatch):
+    async def run():
+        ble = SimulatedBleManager({"AA": -50}, schedule=False)
+        device = CountingDevice("d", Config(config={"mac": "AA"}), Messenger(), ble)
+
+        # do not wait the full timeout
+        monkeypatch.setattr(eq3smart, "NOTIFY_TIMEOUT", 0.01)
+
+        for _ in range(3):
+            await device._pull()
+
+        assert device.queries == 1
+        assert device._schedule_retry is not None
+
+    asyncio.run(run())
+
+
+def test_schedule_is_loaded_from_device():
+    async def run():
+        ble = SimulatedBleManager({"AA": -50})
+        device = Device("d", Config(config={"mac": "AA"}), Messenger(), ble)
+        await device._pull()
+
+        assert device.status()["temperature"] == 21.0
+        assert {day: periods for day, (_, periods) in device._schedule.items()} == {
+            day: PERIODS for day in NAME_TO_DAY
+        }
+
+    asyncio.run(run())
+
+
+def test_unrelated_notifications_do_not_answer_queries():
+    async def run():
+        ble = ChattyBleManager({"AA": -50})
+        device = Device("d", Config(config={"mac": "AA"}), Messenger(), ble)
+
+        assert await device._schedule_query(["mon"]) == ["mon"]
+        assert device._schedule["mon"][1] == PERIODS
+
+    asyncio.run(run())
+
+
+def test_schedule_request_without_known_days_is_ignored():
+    async def run():
+        ble = SimulatedBleManager({"AA": -50})
+        device = CountingDevice("d", Config(config={"mac": "AA"}), Messenger(), ble)
+
+        for payload in ["[]", '["someday"]', '"mon"', "{}", "[1, [2]]"]:
+            await device._mqtt_schedule_get(payload)
+
+        assert device.queries == 0
+        assert not ble.thermostat("AA").writes
+
+    asyncio.run(run())
@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+from devices.eq3smart import Device
+from tools import Config, Snapshot
+
+from simulation import Messenger, SimulatedBleManager
+
+
+def test_flush_is_not_overwritten_by_pending_checkpoint(tmp_path):
+    async def run():
+        filename = tmp_path / "state.json"
+
+        with Snapshot(str(filename), delay=0) as snapshot:
+            snapshot.update("a", {"value": 1})
+
+            # checkpoint is running in the executor while the state changes
+            await asyncio.sleep(0)
+            snapshot.update("a", {"value": 2})
+            snapshot.flush()
+
+            await asyncio.sleep(0.1)
+
+        assert json.loads(filename.read_text()) == {"a": {"value": 2}}
+
+    asyncio.run(run())
+
+
+def test_failed_checkpoint_is_logged(tmp_path, caplog):
+    async def run():
+        snapshot = Snapshot(str(tmp_path / "missing" / "state.json"), delay=0)
+        snapshot.update("a", {"value": 1})
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert "Failed to write snapshot" in caplog.text
+
+
+def test_restored_state_is_kept_until_device_answers(tmp_path):
+    async def run():
+        published = {
+            "available": True,
+            "mode": "heat",
+            "temperature": 21.0,
+            "valve": 30,
+            "action": "heating",
+        }
+        filename = tmp_path / "state.json"
+        filename.write_text(
+            json.dumps(
+                {
+                    "d": {
+                        "state": {
+                            "local": {"temperature": 21.0, "mode": 3},
+                            "remote": {"temperature": 21.0, "mode": 3},
+                        },
+                        "published": published,
+                    }
+                }
+            )
+        )
+
+        with Snapshot(str(filename), delay=0) as snapshot:
+            # device is out of range on the first pull
+            messenger = Messenger()
+            ble = SimulatedBleManager({})
+            config = Config(config={"mac": "AA", "schedule": False})
+            device = Device("d", config, messenger, ble, snapshot)
+            await device._pull()
+
+        assert device.status() == published
+
+    asyncio.run(run())
@@ -0,0 +1,17 @@
+import statistics
+
+import startup
+
+
+# median of a few runs, single runs are affected by other processes
+RUNS = 3
+
+
+def test_import_time_is_within_budget():
+    imports = statistics.median(startup.measure_import() for _ in range(RUNS))
+    assert imports < startup.IMPORT_BUDGET
+
+
+def test_first_publish_is_within_budget():
+    publish = statistics.median(startup.measure_first_publish() for _ in range(RUNS))
+    assert publish < startup.PUBLISH_BUDGET
@@ -0,0 +1,47 @@
+import asyncio
+
+from devices import eq3smart
+from devices.eq3smart import Device
+from tools import Config, tracer
+
+from simulation import Messenger, SimulatedBleManager, Thermostat
+
+
+class Exporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+class SilentThermostat(Thermostat):
+    async def write_gatt_char(self, characteristic, data, *args, **kwargs):
+        pass
+
+
+class SilentBleManager(SimulatedBleManager):
+    def _client(self, handle):
+        return SilentThermostat()
+
+
+def test_notification_timeout_is_traced_as_error(monkeypatch):
+    async def run():
+        exporter = Exporter()
+        tracer.configure(exporter)
+        try:
+            ble = SilentBleManager({"AA": -50})
+            device = Device("d", Config(config={"mac": "AA"}), Messenger(), ble)
+
+            # do not wait the full timeout
+            monkeypatch.setattr(eq3smart, "NOTIFY_TIMEOUT", 0.01)
+
+            with tracer.trace("test"):
+                await device._query(b"\x03")
+        finally:
+            tracer.configure(None)
+
+        notify = [span for span in exporter.spans if span.name == "ble.notify"]
+        assert notify and notify[0].error.startswith("TimeoutError")
+
+    asyncio.run(run())
@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+from ble import BleConnection
+from tools import Config
+from zones import Zone
+
+from simulation import SimulatedBleManager
+
+
+class Member:
+    """
+    Zone member that records the commands it received
+    """
+
+    def __init__(self, id, ble, result=True):
+        self.id = id
+        self.connection = BleConnection(id, ble) if ble is not None else None
+        self.result = result
+        self.commands = []
+
+    async def command(self, command, payload):
+        self.commands.append((command, payload))
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class Messenger:
+    def __init__(self, members):
+        self._members = {member.id: member for member in members}
+        self.published = []
+
+    def device(self, id):
+        return self._members.get(id)
+
+    async def publish(self, device, topic, message, **kwargs):
+        # status is updated in place, keep what was sent
+        self.published.append((topic, json.loads(json.dumps(message))))
+
+
+def test_zone_command_is_planned_by_signal_strength():
+    async def run():
+        ble = SimulatedBleManager({"weak": -90, "strong": -40, "medium": -60})
+        members = [
+            Member("weak", ble),
+            Member("local", None),
+            Member("strong", ble, result=False),
+            Member("medium", ble, result=Exception("unreachable")),
+        ]
+        messenger = Messenger(members)
+        config = Config(config={"devices": [m.id for m in members] + ["unknown"]})
+        zone = Zone("bedrooms", config, messenger, ble)
+
+        status = await zone.execute("temperature_set", "17")
+
+        # unknown members are skipped, devices without radio go last
+        assert list(status["results"]) == ["strong", "medium", "weak", "local"]
+        assert status["results"] == {
+            "strong": "failed",
+            "medium": "error",
+            "weak": "ok",
+            "local": "ok",
+        }
+        assert status["done"] == status["total"] == 4
+        assert all(m.commands == [("temperature_set", "17")] for m in members)
+
+    asyncio.run(run())
+
+
+def test_zone_progress_is_reported():
+    async def run():
+        ble = SimulatedBleManager({"a": -50, "b": -60})
+        members = [Member("a", ble), Member("b", ble)]
+        messenger = Messenger(members)
+        zone = Zone("all", Config(config={"devices": ["a", "b"]}), messenger, ble)
+
+        await zone.command("mode_set", "auto")
+
+        progress = [
+            (message["done"], message["results"])
+            for topic, message in messenger.published
+        ]
+        assert {topic for topic, _ in messenger.published} == {"status"}
+        assert progress == [
+            (0, {"a": "pending", "b": "pending"}),
+            (1, {"a": "ok", "b": "pending"}),
+            (2, {"a": "ok", "b": "ok"}),
+        ]
+
+    asyncio.run(run())
+
+
+def test_cluster_instances_report_their_own_members():
+    async def run():
+        ble = SimulatedBleManager({"a1": -50})
+        messenger = Messenger([Member("a1", ble)])
+        config = Config(config={"devices": ["a1", "b1"]})
+
+        # b1 is driven by another instance
+        zone = Zone("all", config, messenger, ble, instance="a")
+        await zone.command("temperature_set", "17")
+
+        topic, status = messenger.published[-1]
+        assert topic == "status/a"
+        assert status["instance"] == "a"
+        assert status["results"] == {"a1": "ok"}
+
+        # instance without members of the zone
+        messenger = Messenger([])
+        zone = Zone("all", config, messenger, ble, instance="b")
+        await zone.command("temperature_set", "17")
+        assert messenger.published == []
+
+    asyncio.run(run())